@@ -336,6 +336,8 @@ Now you know the basics! Try experimenting with these concepts and build your ow
             'if': 'Conditional execution',
             'else': 'Alternative execution path',
             'loop': 'Repetitive execution',
+            'for': 'Repeats for every item of a range, list or map',
+            'in': 'Separates a for loop variable from what it goes through',
             'return': 'Returns a value from function',
             'true': 'Boolean true value',
             'false': 'Boolean false value',
@@ -351,7 +353,18 @@ Now you know the basics! Try experimenting with these concepts and build your ow
             'length': 'Returns length of string/array',
             'string': 'Converts value to string',
             'number': 'Converts value to number',
-            'random': 'Generates random number'
+            'random': 'Generates random number',
+            'range': 'Counts from a start up to an end, one step at a time',
+            'sum': 'Adds up the numbers in a list',
+            'min': 'Returns the smallest item of a list',
+            'max': 'Returns the biggest item of a list',
+            'sort': 'Returns the items of a list in order',
+            'map_add': 'Adds a number or list to every item of a list',
+            'dot': 'Multiplies two lists item by item and adds the results',
+            'get': 'Looks up the value stored under a key of a map',
+            'set': 'Stores a value under a key of a map',
+            'has': 'Checks whether a map has a key',
+            'keys': 'Returns the keys of a map as a list'
         }
         return desc_map.get(standard, 'No description available')
     
@@ -383,6 +383,22 @@ class FileOperations:
             
             with open(os.path.join(examples_dir, f'variables.{file_ext}'), 'w', encoding='utf-8') as f:
                 f.write(var_example)
+        
+        # Recursion example: thousands of nested calls, which every engine must run
+        keywords = self.language_data.get('keywords', {})
+        if keywords.get('function') and keywords.get('if') and keywords.get('return'):
+            recursion_example = f'''# Deep recursion in {self.language_data['name']}
+{keywords['function']} depth(n) {{
+    {keywords['if']} n == 0 {{
+        {keywords['return']} 0
+    }}
+    {keywords['return']} 1 + depth(n - 1)
+}}
+{self.language_data.get('builtins', {}).get('print', 'print')}("Depth:", depth(5000))
+'''
+            
+            with open(os.path.join(examples_dir, f'recursion.{file_ext}'), 'w', encoding='utf-8') as f:
+                f.write(recursion_example)
     
     def create_documentation(self, project_folder):
         """Create language documentation"""
@@ -666,6 +682,23 @@ while (i < 5) {{
         
         with open(control_file, 'w', encoding='utf-8') as f:
             f.write(control_code)
+        
+        # Recursion example: thousands of nested calls, which every engine must run
+        return_kw = keywords.get('return', 'return')
+        recursion_file = os.path.join(examples_folder, f'recursion.{extension}')
+        recursion_code = f'''# Deep recursion example in {self.language_data['name']}
+{func_kw} depth(n) {{
+    {if_kw} n == 0 {{
+        {return_kw} 0
+    }}
+    {return_kw} 1 + depth(n - 1)
+}}
+
+{print_kw}("Depth:", depth(5000))
+'''
+        
+        with open(recursion_file, 'w', encoding='utf-8') as f:
+            f.write(recursion_code)
     
     def create_enhanced_documentation(self, project_folder, extension):
         """Create enhanced documentation"""
@@ -972,6 +1005,8 @@ class TemplateManager:
                     'if': 'if',
                     'else': 'else',
                     'loop': 'while',
+                    'for': 'for',
+                    'in': 'in',
                     'return': 'return',
                     'true': 'true',
                     'false': 'false',
@@ -983,7 +1018,18 @@ class TemplateManager:
                     'length': 'len',
                     'string': 'str',
                     'number': 'num',
-                    'random': 'rand'
+                    'random': 'rand',
+                    'range': 'range',
+                    'sum': 'sum',
+                    'min': 'min',
+                    'max': 'max',
+                    'sort': 'sort',
+                    'map_add': 'map_add',
+                    'dot': 'dot',
+                    'get': 'get',
+                    'set': 'set',
+                    'has': 'has',
+                    'keys': 'keys'
                 },
                 'errors': {
                     'syntax': 'Syntax error',
@@ -1002,6 +1048,8 @@ class TemplateManager:
                     'if': 'when',
                     'else': 'otherwise',
                     'loop': 'repeat',
+                    'for': 'each',
+                    'in': 'in',
                     'return': 'give',
                     'true': 'yes',
                     'false': 'no',
@@ -1013,7 +1061,18 @@ class TemplateManager:
                     'length': 'count',
                     'string': 'words',
                     'number': 'number',
-                    'random': 'surprise'
+                    'random': 'surprise',
+                    'range': 'counting',
+                    'sum': 'total',
+                    'min': 'smallest',
+                    'max': 'biggest',
+                    'sort': 'order',
+                    'map_add': 'add_each',
+                    'dot': 'dot',
+                    'get': 'lookup',
+                    'set': 'store',
+                    'has': 'has',
+                    'keys': 'names'
                 },
                 'errors': {
                     'syntax': 'Oops! Something is wrong with your code',
@@ -53,6 +53,13 @@ class LanguageValidator:
 class InterpreterGenerator:
     """Generates complete working interpreters for custom languages"""
     
+    # Starts the JSON line of each file in --batch output, so the test
+    # runner can tell it from prompts and other text on stdout
+    BATCH_RECORD_PREFIX = '@slang-record '
+    
+    # Execution engines of the generated interpreter; the first is the default
+    ENGINES = ('closure', 'tree', 'vm', 'python')
+    
     def __init__(self, language_data):
         self.language_data = language_data
     
@@ -70,130 +77,186 @@ Version: {self.language_data.get('version', '1.0')}
 Author: {self.language_data.get('author', 'Unknown')}
 """
 
+import argparse
+import hashlib
 import json
+import marshal
+import math
+import mmap
+import operator
 import sys
 import os
 import re
 import random
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict, deque
 from typing import Dict, List, Any, Optional
 
+# NumPy, when installed, adds up float lists in bulk
+try:
+    import numpy
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+ENGINES = {InterpreterGenerator.ENGINES!r}
+
+# Files a directory given to --batch contributes
+SOURCE_SUFFIX = '.{lang_name[:3]}'
+
+# Starts the JSON line --batch prints for each file
+BATCH_RECORD_PREFIX = {InterpreterGenerator.BATCH_RECORD_PREFIX!r}
+
+# Characters read at a time by --stream; doubled while a statement is incomplete
+STREAM_CHUNK_SIZE = 1 << 16
+
+# Python frames and thread stack bytes the program runs with; deep enough
+# for tens of thousands of nested calls in every engine
+RECURSION_LIMIT = 1 << 18
+THREAD_STACK_SIZE = 1 << 30
+{self._generate_lexer()}
+
+# Marks a frame slot whose local has not been assigned yet
+UNSET = object()
+{self._generate_list_values()}
+# Type feedback of a BINARY node nothing has been recorded for: the types
+# and handler of its specialization, the types seen last and how often they
+# changed
+NO_TYPE_FEEDBACK = (None, None, None, None, 0)
+
+{self._generate_ast_nodes()}{self._generate_bytecode_vm()}
+{self._generate_python_backend()}
+{self._generate_ast_cache()}
+{self._generate_optimizer()}
+{self._generate_binary_specializations()}
+{self._generate_memo_table()}
+{self._generate_output_sinks()}
+{self._generate_profiler()}
+{self._generate_sampling_profiler()}
+
 class {self.language_data['name'].replace(' ', '')}Interpreter:
-    def __init__(self, language_file='language.json'):
+    def __init__(self, language_file='language.json', engine='closure', use_cache=True, use_optimizer=True,
+                 disabled_passes=(), memoize=False, memo_size=MemoTable.MAX_SIZE, output=None):
         self.language_file = language_file
+        self.engine = engine
+        self.use_cache = use_cache
+        self.use_optimizer = use_optimizer
         self.load_language_definition()
+        self.memoize = memoize or bool(self.features.get('memoize'))
+        self.memo_size = memo_size
+        self.optimizer = Optimizer(self.is_truthy, self.builtin_map,
+                                   [name for name in Optimizer.PASSES if name not in disabled_passes])
+        self.output = output if output is not None else BufferSink()
+        self.cache_epoch = 0
+        self.reset()
+    
+    def reset(self):
+        """Forget the state of the program run before, keeping the language tables"""
         self.variables = {{}}
         self.functions = {{}}
+        self.cache_epoch += 1
+        self.compiled_bodies = {{}}
+        self.frame = None
+        self.frames = []
+        self.dynamic_names = set()
         self.call_stack = []
-        self.output_buffer = []
+        self.memo_tables = {{}}
+        self.last_error = None
+        self.output.clear()
+        self.set_tokens(self.lexer.tokenize(''))
         
     def load_language_definition(self):
         """Load the language definition from JSON"""
         script_dir = os.path.dirname(os.path.abspath(__file__))
         lang_path = os.path.join(os.path.dirname(script_dir), self.language_file)
         
-        with open(lang_path, 'r', encoding='utf-8') as f:
-            self.lang_def = json.load(f)
+        with open(lang_path, 'rb') as f:
+            lang_bytes = f.read()
+        self.lang_def = json.loads(lang_bytes.decode('utf-8'))
+        self.language_hash = hashlib.sha256(lang_bytes).hexdigest()
         
         # Extract keywords and builtins
         self.keywords = self.lang_def.get('keywords', {{}})
         self.builtins = self.lang_def.get('builtins', {{}})
         self.errors = self.lang_def.get('errors', {{}})
+        self.features = self.lang_def.get('features', {{}})
         
         # Create reverse mappings (custom -> english)
         self.keyword_map = {{v: k for k, v in self.keywords.items() if v}}
         self.builtin_map = {{v: k for k, v in self.builtins.items() if v}}
+        
+        # Builtin handlers by the name a call site uses, custom names first
+        handlers = {{
+            'print': self.builtin_print,
+            'input': self.builtin_input,
+            'length': self.builtin_length,
+            'string': self.builtin_string,
+            'number': self.builtin_number,
+            'random': self.builtin_random,
+            'range': self.builtin_range,
+            'sum': self.builtin_sum,
+            'min': self.builtin_min,
+            'max': self.builtin_max,
+            'sort': self.builtin_sort,
+            'map_add': self.builtin_map_add,
+            'dot': self.builtin_dot,
+            'get': self.builtin_get,
+            'set': self.builtin_set,
+            'has': self.builtin_has,
+            'keys': self.builtin_keys,
+        }}
+        self.builtin_handlers = dict(handlers)
+        self.builtin_handlers.update((custom, handlers[standard]) for custom, standard in self.builtin_map.items()
+                                     if standard in handlers)
+        
+        # Build the lexer tables once per language definition
+        self.lexer = Lexer(self.lang_def)
+        
+        # Kind codes of the keywords the parser dispatches on
+        kind = self.lexer.kind_ids.get
+        self.kind_variable = kind('KEYWORD_VARIABLE', T_NONE)
+        self.kind_function = kind('KEYWORD_FUNCTION', T_NONE)
+        self.kind_if = kind('KEYWORD_IF', T_NONE)
+        self.kind_else = kind('KEYWORD_ELSE', T_NONE)
+        self.kind_loop = kind('KEYWORD_LOOP', T_NONE)
+        self.kind_for = kind('KEYWORD_FOR', T_NONE)
+        self.kind_in = kind('KEYWORD_IN', T_NONE)
+        self.kind_return = kind('KEYWORD_RETURN', T_NONE)
     
-    def tokenize(self, code: str) -> List[Dict[str, Any]]:
+    def tokenize(self, code: str) -> TokenStream:
         """Tokenize the source code"""
-        tokens = []
-        lines = code.split('\\n')
-        
-        for line_num, line in enumerate(lines, 1):
-            # Skip empty lines and comments
-            stripped = line.strip()
-            if not stripped or stripped.startswith('#'):
-                continue
-            
-            # Tokenize the line
-            pattern = r'("(?:[^"\\\\]|\\\\.)*"|\\\'(?:[^\\\'\\\\]|\\\\.)*\\\'|[a-zA-Z_][a-zA-Z0-9_]*|[0-9]+\\.?[0-9]*|==|!=|<=|>=|&&|\\|\\||[+\\-*/=<>(){{}}\\[\\],])'
-            
-            matches = re.findall(pattern, line)
-            col = 0
-            
-            for match in matches:
-                token_type = self.get_token_type(match)
-                tokens.append({{
-                    'type': token_type,
-                    'value': match,
-                    'line': line_num,
-                    'column': col
-                }})
-                col += len(match) + 1
-        
-        return tokens
+        return self.lexer.tokenize(code)
     
     def get_token_type(self, token: str) -> str:
         """Determine the type of a token"""
-        # Check if it's a keyword
-        if token in self.keyword_map:
-            return f'KEYWORD_{{self.keyword_map[token].upper()}}'
-        
-        # Check if it's a builtin function
-        if token in self.builtin_map:
-            return f'BUILTIN_{{self.builtin_map[token].upper()}}'
-        
-        # Check for literals
-        if token.startswith('"') or token.startswith("'"):
-            return 'STRING'
-        
-        if re.match(r'^[0-9]+\\.?[0-9]*$', token):
-            return 'NUMBER'
-        
-        # Check for operators
-        operators = {{
-            self.lang_def.get('operators', {{}}).get('addition', '+'): 'PLUS', 
-            self.lang_def.get('operators', {{}}).get('subtraction', '-'): 'MINUS', 
-            self.lang_def.get('operators', {{}}).get('multiplication', '*'): 'MULTIPLY', 
-            self.lang_def.get('operators', {{}}).get('division', '/'): 'DIVIDE',
-            self.lang_def.get('operators', {{}}).get('assign', '='): 'ASSIGN', 
-            self.lang_def.get('operators', {{}}).get('equal', '=='): 'EQUALS', 
-            self.lang_def.get('operators', {{}}).get('not_equal', '!='): 'NOT_EQUALS',
-            self.lang_def.get('operators', {{}}).get('less_than', '<'): 'LESS', 
-            self.lang_def.get('operators', {{}}).get('greater_than', '>'): 'GREATER', 
-            self.lang_def.get('operators', {{}}).get('less_equal', '<='): 'LESS_EQUAL', 
-            self.lang_def.get('operators', {{}}).get('greater_equal', '>='): 'GREATER_EQUAL',
-            self.lang_def.get('operators', {{}}).get('and', '&&'): 'AND', 
-            self.lang_def.get('operators', {{}}).get('or', '||'): 'OR'
-        }}
-        
-        if token in operators:
-            return operators[token]
-        
-        # Check for delimiters
-        delimiters = {{
-            '(': 'LPAREN', ')': 'RPAREN',
-            '{{': 'LBRACE', '}}': 'RBRACE',
-            '[': 'LBRACKET', ']': 'RBRACKET',
-            ',': 'COMMA'
-        }}
-        
-        if token in delimiters:
-            return delimiters[token]
-        
-        # Check for boolean values
-        if token == self.builtins.get('true', 'true'):
-            return 'TRUE'
-        if token == self.builtins.get('false', 'false'):
-            return 'FALSE'
-        
-        # Otherwise it's an identifier
-        return 'IDENTIFIER'
+        return self.lexer.classify(token)
     
-    def parse(self, tokens: List[Dict[str, Any]]):
-        """Parse tokens into an AST"""
+    def set_tokens(self, tokens: TokenStream):
+        """Point the parser at the start of a token stream"""
         self.tokens = tokens
+        self.kinds = tokens.kinds
+        self.values = tokens.values
         self.current = 0
-        return self.parse_program()
+    
+    def parse(self, tokens: TokenStream):
+        """Parse tokens into an AST"""
+        self.set_tokens(tokens)
+        return self.resolve(self.optimize(self.parse_program()))
+    
+    def optimize(self, ast, whole_program=True):
+        """Run the optimizer over a parsed program unless it is switched off"""
+        if not self.use_optimizer:
+            return ast
+        return self.optimizer.optimize(ast, whole_program)
+    
+    def optimizer_key(self):
+        """The optimizer passes that shape the AST, as part of the cache keys"""
+        if not self.use_optimizer:
+            return 'off'
+        return ','.join(sorted(self.optimizer.passes))
     
     def parse_program(self):
         """Parse the entire program"""
@@ -202,23 +265,26 @@ class {self.language_data['name'].replace(' ', '')}Interpreter:
             stmt = self.parse_statement()
             if stmt:
                 statements.append(stmt)
-        return {{'type': 'PROGRAM', 'statements': statements}}
+        return Program(statements)
     
     def parse_statement(self):
         """Parse a single statement"""
-        if self.match('KEYWORD_VARIABLE'):
+        if self.match(self.kind_variable):
             return self.parse_variable_declaration()
-        elif self.match('KEYWORD_FUNCTION'):
+        elif self.match(self.kind_function):
             return self.parse_function_declaration()
-        elif self.match('KEYWORD_IF'):
+        elif self.match(self.kind_if):
             return self.parse_if_statement()
-        elif self.match('KEYWORD_LOOP'):
+        elif self.match(self.kind_loop):
             return self.parse_loop_statement()
-        elif self.match('KEYWORD_RETURN'):
+        elif self.match(self.kind_for):
+            return self.parse_for_statement()
+        elif self.match(self.kind_return):
             return self.parse_return_statement()
-        elif self.check_type('BUILTIN_PRINT'):
+        elif self.check_builtin():
+            # A builtin called for its effect, such as print or set
             return self.parse_expression_statement()
-        elif self.check_type('IDENTIFIER'):
+        elif self.check(T_IDENTIFIER):
             # Could be assignment or function call
             return self.parse_expression_statement()
         else:
@@ -227,122 +293,126 @@ class {self.language_data['name'].replace(' ', '')}Interpreter:
     
     def parse_variable_declaration(self):
         """Parse variable declaration"""
-        name = self.consume('IDENTIFIER', 'Expected variable name')
+        name = self.consume(T_IDENTIFIER, 'Expected variable name')
         
-        if self.match('ASSIGN'):
+        if self.match(T_ASSIGN):
             value = self.parse_expression()
-            return {{'type': 'VAR_DECL', 'name': name['value'], 'value': value}}
+            return VarDecl(name, value)
         
-        return {{'type': 'VAR_DECL', 'name': name['value'], 'value': None}}
+        return VarDecl(name, None)
     
     def parse_function_declaration(self):
         """Parse function declaration"""
-        name = self.consume('IDENTIFIER', 'Expected function name')
+        name = self.consume(T_IDENTIFIER, 'Expected function name')
         
-        self.consume('LPAREN', 'Expected ( after function name')
+        self.consume(T_LPAREN, 'Expected ( after function name')
         
         params = []
-        if not self.check('RPAREN'):
-            params.append(self.consume('IDENTIFIER', 'Expected parameter name')['value'])
-            while self.match('COMMA'):
-                params.append(self.consume('IDENTIFIER', 'Expected parameter name')['value'])
+        if not self.check(T_RPAREN):
+            params.append(self.consume(T_IDENTIFIER, 'Expected parameter name'))
+            while self.match(T_COMMA):
+                params.append(self.consume(T_IDENTIFIER, 'Expected parameter name'))
         
-        self.consume('RPAREN', 'Expected ) after parameters')
-        self.consume('LBRACE', 'Expected {{ before function body')
+        self.consume(T_RPAREN, 'Expected ) after parameters')
+        self.consume(T_LBRACE, 'Expected {{ before function body')
         
         body = []
-        while not self.check('RBRACE') and not self.is_at_end():
+        while not self.check(T_RBRACE) and not self.is_at_end():
             stmt = self.parse_statement()
             if stmt:
                 body.append(stmt)
         
-        self.consume('RBRACE', 'Expected }} after function body')
+        self.consume(T_RBRACE, 'Expected }} after function body')
         
-        return {{
-            'type': 'FUNC_DECL',
-            'name': name['value'],
-            'params': params,
-            'body': body
-        }}
+        return FuncDecl(name, params, body)
     
     def parse_if_statement(self):
         """Parse if statement"""
         condition = self.parse_expression()
         
-        self.consume('LBRACE', 'Expected {{ after if condition')
+        self.consume(T_LBRACE, 'Expected {{ after if condition')
         then_branch = []
         
-        while not self.check('RBRACE') and not self.is_at_end():
+        while not self.check(T_RBRACE) and not self.is_at_end():
             stmt = self.parse_statement()
             if stmt:
                 then_branch.append(stmt)
         
-        self.consume('RBRACE', 'Expected }} after if body')
+        self.consume(T_RBRACE, 'Expected }} after if body')
         
         else_branch = None
-        if self.match('KEYWORD_ELSE'):
-            if self.match('KEYWORD_IF'):
+        if self.match(self.kind_else):
+            if self.match(self.kind_if):
                 # else if
                 else_branch = [self.parse_if_statement()]
             else:
-                self.consume('LBRACE', 'Expected {{ after else')
+                self.consume(T_LBRACE, 'Expected {{ after else')
                 else_branch = []
                 
-                while not self.check('RBRACE') and not self.is_at_end():
+                while not self.check(T_RBRACE) and not self.is_at_end():
                     stmt = self.parse_statement()
                     if stmt:
                         else_branch.append(stmt)
                 
-                self.consume('RBRACE', 'Expected }} after else body')
+                self.consume(T_RBRACE, 'Expected }} after else body')
         
-        return {{
-            'type': 'IF_STMT',
-            'condition': condition,
-            'then_branch': then_branch,
-            'else_branch': else_branch
-        }}
+        return If(condition, then_branch, else_branch)
     
     def parse_loop_statement(self):
         """Parse loop statement"""
         condition = self.parse_expression()
         
-        self.consume('LBRACE', 'Expected {{ after loop condition')
+        self.consume(T_LBRACE, 'Expected {{ after loop condition')
         body = []
         
-        while not self.check('RBRACE') and not self.is_at_end():
+        while not self.check(T_RBRACE) and not self.is_at_end():
             stmt = self.parse_statement()
             if stmt:
                 body.append(stmt)
         
-        self.consume('RBRACE', 'Expected }} after loop body')
+        self.consume(T_RBRACE, 'Expected }} after loop body')
         
-        return {{
-            'type': 'LOOP_STMT',
-            'condition': condition,
-            'body': body
-        }}
+        return Loop(condition, body)
+    
+    def parse_for_statement(self):
+        """Parse for statement"""
+        name = self.consume(T_IDENTIFIER, 'Expected loop variable name')
+        self.consume(self.kind_in, 'Expected in after loop variable')
+        iterable = self.parse_expression()
+        
+        self.consume(T_LBRACE, 'Expected {{ after for iterable')
+        body = []
+        
+        while not self.check(T_RBRACE) and not self.is_at_end():
+            stmt = self.parse_statement()
+            if stmt:
+                body.append(stmt)
+        
+        self.consume(T_RBRACE, 'Expected }} after for body')
+        
+        return For(name, iterable, body)
     
     def parse_return_statement(self):
         """Parse return statement"""
         value = None
-        if not self.is_at_end() and not self.check('RBRACE'):
+        if not self.is_at_end() and not self.check(T_RBRACE):
             value = self.parse_expression()
         
-        return {{'type': 'RETURN_STMT', 'value': value}}
+        return Return(value)
     
     def parse_expression_statement(self):
         """Parse expression statement"""
         expr = self.parse_expression()
         
         # Check if it's an assignment
-        if self.match('ASSIGN'):
-            if expr['type'] != 'IDENTIFIER':
+        if self.match(T_ASSIGN):
+            if expr.type != 'IDENTIFIER':
                 self.error('Invalid assignment target')
             
             value = self.parse_expression()
-            return {{'type': 'ASSIGN', 'name': expr['value'], 'value': value}}
+            return Assign(expr.value, value)
         
-        return {{'type': 'EXPR_STMT', 'expression': expr}}
+        return ExprStmt(expr)
     
     def parse_expression(self):
         """Parse expression"""
@@ -352,10 +422,10 @@ class {self.language_data['name'].replace(' ', '')}Interpreter:
         """Parse logical OR expression"""
         expr = self.parse_logical_and()
         
-        while self.match('OR'):
-            op = self.previous()
+        while self.match(T_OR):
+            op = self.previous_type()
             right = self.parse_logical_and()
-            expr = {{'type': 'BINARY', 'left': expr, 'operator': op['type'], 'right': right}}
+            expr = Binary(expr, op, right)
         
         return expr
     
@@ -363,10 +433,10 @@ class {self.language_data['name'].replace(' ', '')}Interpreter:
         """Parse logical AND expression"""
         expr = self.parse_equality()
         
-        while self.match('AND'):
-            op = self.previous()
+        while self.match(T_AND):
+            op = self.previous_type()
             right = self.parse_equality()
-            expr = {{'type': 'BINARY', 'left': expr, 'operator': op['type'], 'right': right}}
+            expr = Binary(expr, op, right)
         
         return expr
     
@@ -374,10 +444,10 @@ class {self.language_data['name'].replace(' ', '')}Interpreter:
         """Parse equality expression"""
         expr = self.parse_comparison()
         
-        while self.match('EQUALS', 'NOT_EQUALS'):
-            op = self.previous()
+        while self.match(T_EQUALS, T_NOT_EQUALS):
+            op = self.previous_type()
             right = self.parse_comparison()
-            expr = {{'type': 'BINARY', 'left': expr, 'operator': op['type'], 'right': right}}
+            expr = Binary(expr, op, right)
         
         return expr
     
@@ -385,10 +455,10 @@ class {self.language_data['name'].replace(' ', '')}Interpreter:
         """Parse comparison expression"""
         expr = self.parse_addition()
         
-        while self.match('GREATER', 'GREATER_EQUAL', 'LESS', 'LESS_EQUAL'):
-            op = self.previous()
+        while self.match(T_GREATER, T_GREATER_EQUAL, T_LESS, T_LESS_EQUAL):
+            op = self.previous_type()
             right = self.parse_addition()
-            expr = {{'type': 'BINARY', 'left': expr, 'operator': op['type'], 'right': right}}
+            expr = Binary(expr, op, right)
         
         return expr
     
@@ -396,10 +466,10 @@ class {self.language_data['name'].replace(' ', '')}Interpreter:
         """Parse addition/subtraction expression"""
         expr = self.parse_multiplication()
         
-        while self.match('PLUS', 'MINUS'):
-            op = self.previous()
+        while self.match(T_PLUS, T_MINUS):
+            op = self.previous_type()
             right = self.parse_multiplication()
-            expr = {{'type': 'BINARY', 'left': expr, 'operator': op['type'], 'right': right}}
+            expr = Binary(expr, op, right)
         
         return expr
     
@@ -407,254 +477,658 @@ class {self.language_data['name'].replace(' ', '')}Interpreter:
         """Parse multiplication/division expression"""
         expr = self.parse_unary()
         
-        while self.match('MULTIPLY', 'DIVIDE'):
-            op = self.previous()
+        while self.match(T_MULTIPLY, T_DIVIDE):
+            op = self.previous_type()
             right = self.parse_unary()
-            expr = {{'type': 'BINARY', 'left': expr, 'operator': op['type'], 'right': right}}
+            expr = Binary(expr, op, right)
         
         return expr
     
     def parse_unary(self):
         """Parse unary expression"""
-        if self.match('MINUS'):
-            op = self.previous()
+        if self.match(T_MINUS):
+            op = self.previous_type()
             expr = self.parse_unary()
-            return {{'type': 'UNARY', 'operator': op['type'], 'operand': expr}}
+            return Unary(op, expr)
+        
+        return self.parse_index()
+    
+    def parse_index(self):
+        """Parse indexing expression"""
+        expr = self.parse_primary()
+        
+        while self.match(T_LBRACKET):
+            index = self.parse_expression()
+            self.consume(T_RBRACKET, 'Expected ] after index')
+            expr = Index(expr, index)
         
-        return self.parse_primary()
+        return expr
     
     def parse_primary(self):
         """Parse primary expression"""
         # Boolean literals
-        if self.match('TRUE'):
-            return {{'type': 'LITERAL', 'value': True}}
+        if self.match(T_TRUE):
+            return Literal(True)
         
-        if self.match('FALSE'):
-            return {{'type': 'LITERAL', 'value': False}}
+        if self.match(T_FALSE):
+            return Literal(False)
         
         # Number literal
-        if self.match('NUMBER'):
-            value = self.previous()['value']
-            return {{'type': 'LITERAL', 'value': float(value) if '.' in value else int(value)}}
+        if self.match(T_NUMBER):
+            value = self.previous()
+            return Literal(float(value) if '.' in value else int(value))
         
         # String literal
-        if self.match('STRING'):
-            value = self.previous()['value'][1:-1]  # Remove quotes
-            return {{'type': 'LITERAL', 'value': value}}
+        if self.match(T_STRING):
+            value = self.previous()[1:-1]  # Remove quotes
+            return Literal(value)
         
         # Function call or identifier
-        if self.check_type('BUILTIN') or self.check_type('IDENTIFIER'):
-            token = self.advance()
+        if self.check(T_IDENTIFIER) or self.check_builtin():
+            is_builtin = self.check_builtin()
+            name = self.advance()
             
             # Check if it's a function call
-            if self.match('LPAREN'):
+            if self.match(T_LPAREN):
                 args = []
                 
-                if not self.check('RPAREN'):
+                if not self.check(T_RPAREN):
                     args.append(self.parse_expression())
-                    while self.match('COMMA'):
+                    while self.match(T_COMMA):
                         args.append(self.parse_expression())
                 
-                self.consume('RPAREN', 'Expected ) after arguments')
+                self.consume(T_RPAREN, 'Expected ) after arguments')
                 
-                return {{
-                    'type': 'CALL',
-                    'callee': token['value'],
-                    'arguments': args,
-                    'is_builtin': token['type'].startswith('BUILTIN')
-                }}
+                return Call(name, args, is_builtin)
             
             # Just an identifier
-            return {{'type': 'IDENTIFIER', 'value': token['value']}}
+            return Identifier(name)
+        
+        # List literal
+        if self.match(T_LBRACKET):
+            elements = []
+            
+            if not self.check(T_RBRACKET):
+                elements.append(self.parse_expression())
+                while self.match(T_COMMA):
+                    elements.append(self.parse_expression())
+            
+            self.consume(T_RBRACKET, 'Expected ] after list elements')
+            
+            return ListLiteral(elements)
+        
+        # Map literal: keys and values alternate in its items
+        if self.match(T_LBRACE):
+            items = []
+            
+            if not self.check(T_RBRACE):
+                while True:
+                    items.append(self.parse_expression())
+                    self.consume(T_COLON, 'Expected : after map key')
+                    items.append(self.parse_expression())
+                    if not self.match(T_COMMA):
+                        break
+            
+            self.consume(T_RBRACE, 'Expected }} after map entries')
+            
+            return MapLiteral(items)
         
         # Grouped expression
-        if self.match('LPAREN'):
+        if self.match(T_LPAREN):
             expr = self.parse_expression()
-            self.consume('RPAREN', 'Expected ) after expression')
+            self.consume(T_RPAREN, 'Expected ) after expression')
             return expr
         
-        self.error(f"Unexpected token: {{self.peek()['value'] if not self.is_at_end() else 'EOF'}}")
+        self.error(f"Unexpected token: {{self.peek() if not self.is_at_end() else 'EOF'}}")
     
     def execute(self, ast):
-        """Execute the AST"""
+        """Execute the AST with the selected engine"""
         try:
-            self.execute_node(ast)
-            return '\\n'.join(self.output_buffer)
+            if self.engine == 'tree':
+                self.execute_node(ast)
+            elif self.engine == 'vm':
+                self.run_vm(ast)
+            else:
+                self.compile_program(ast)()
+            return self.output_text()
         except Exception as e:
-            return f"Runtime error: {{str(e)}}"
+            # The calls the error unwound never returned
+            self.call_stack.clear()
+            return self.output_text(f"Runtime error: {{str(e)}}")
+    
+    def output_text(self, error=None):
+        """What a run returns: the output the sink kept, then the runtime error if there was one
+        
+        A buffering sink drops its output on an error; streaming sinks have
+        written theirs already and write what is pending first.
+        """
+        self.last_error = error
+        if error is None:
+            self.output.flush()
+            return self.output.getvalue()
+        self.output.abort()
+        output = self.output.getvalue()
+        return f"{{output}}\\n{{error}}" if output else error
     
     def execute_node(self, node):
         """Execute a single AST node"""
         if node is None:
             return None
         
-        node_type = node.get('type')
+        node_type = node.type
         
         if node_type == 'PROGRAM':
-            for stmt in node['statements']:
+            for stmt in node.statements:
                 result = self.execute_node(stmt)
                 if isinstance(result, dict) and result.get('type') == 'RETURN':
                     return result
         
         elif node_type == 'VAR_DECL':
             value = None
-            if node['value']:
-                value = self.execute_node(node['value'])
-            self.variables[node['name']] = value
+            if node.value:
+                value = self.execute_node(node.value)
+            self.assign_variable(node, value)
         
         elif node_type == 'FUNC_DECL':
-            self.functions[node['name']] = node
+            self.define_function(node)
         
         elif node_type == 'IF_STMT':
-            condition = self.execute_node(node['condition'])
+            condition = self.execute_node(node.condition)
             if self.is_truthy(condition):
-                for stmt in node['then_branch']:
+                for stmt in node.then_branch:
                     result = self.execute_node(stmt)
                     if isinstance(result, dict) and result.get('type') == 'RETURN':
                         return result
-            elif node['else_branch']:
-                for stmt in node['else_branch']:
+            elif node.else_branch:
+                for stmt in node.else_branch:
                     result = self.execute_node(stmt)
                     if isinstance(result, dict) and result.get('type') == 'RETURN':
                         return result
         
         elif node_type == 'LOOP_STMT':
-            while self.is_truthy(self.execute_node(node['condition'])):
-                for stmt in node['body']:
+            if node.hoisted:
+                self.clear_hoisted(node, self.frame)
+            if node.counting_step is not None:
+                result = self.execute_counting_loop(node)
+                if result is not UNSET:
+                    return result
+            while self.is_truthy(self.execute_node(node.condition)):
+                for stmt in node.body:
+                    result = self.execute_node(stmt)
+                    if isinstance(result, dict) and result.get('type') == 'RETURN':
+                        return result
+        
+        elif node_type == 'FOR_STMT':
+            for value in self.iterate(self.execute_node(node.iterable)):
+                self.assign_variable(node, value)
+                for stmt in node.body:
                     result = self.execute_node(stmt)
                     if isinstance(result, dict) and result.get('type') == 'RETURN':
                         return result
         
         elif node_type == 'RETURN_STMT':
             value = None
-            if node['value']:
-                value = self.execute_node(node['value'])
+            if node.value:
+                value = self.execute_node(node.value)
             return {{'type': 'RETURN', 'value': value}}
         
         elif node_type == 'EXPR_STMT':
-            self.execute_node(node['expression'])
+            self.execute_node(node.expression)
         
         elif node_type == 'ASSIGN':
-            value = self.execute_node(node['value'])
-            self.variables[node['name']] = value
+            value = self.execute_node(node.value)
+            self.assign_variable(node, value)
         
         elif node_type == 'BINARY':
-            left = self.execute_node(node['left'])
-            right = self.execute_node(node['right'])
-            
-            operators = {{
-                'PLUS': lambda: left + right,
-                'MINUS': lambda: left - right,
-                'MULTIPLY': lambda: left * right,
-                'DIVIDE': lambda: left / right if right != 0 else self.error("Division by zero"),
-                'EQUALS': lambda: left == right,
-                'NOT_EQUALS': lambda: left != right,
-                'LESS': lambda: left < right,
-                'GREATER': lambda: left > right,
-                'LESS_EQUAL': lambda: left <= right,
-                'GREATER_EQUAL': lambda: left >= right,
-                'AND': lambda: self.is_truthy(left) and self.is_truthy(right),
-                'OR': lambda: self.is_truthy(left) or self.is_truthy(right)
-            }}
+            left = self.execute_node(node.left)
+            right = self.execute_node(node.right)
             
-            return operators[node['operator']]()
+            # Specialized handler while the operand types stay the ones it is for
+            cache = node.cache
+            if type(left) is cache[0] and type(right) is cache[1]:
+                try:
+                    return cache[2](left, right)
+                except ZeroDivisionError:
+                    self.error("Division by zero")
+            return self.execute_binary(node, left, right)
         
         elif node_type == 'UNARY':
-            operand = self.execute_node(node['operand'])
-            if node['operator'] == 'MINUS':
+            operand = self.execute_node(node.operand)
+            if node.operator == 'MINUS':
                 return -operand
         
         elif node_type == 'LITERAL':
-            return node['value']
+            return node.value
         
         elif node_type == 'IDENTIFIER':
-            if node['value'] in self.variables:
-                return self.variables[node['value']]
-            else:
-                self.error(f"Undefined variable: {{node['value']}}")
+            return self.lookup_variable(node)
+        
+        elif node_type == 'HOISTED':
+            value = self.frame[node.slot] if node.slot is not None else self.variables.get(node.name, UNSET)
+            if value is UNSET:
+                value = self.execute_node(node.expression)
+                self.assign_variable(node, value)
+            return value
         
         elif node_type == 'CALL':
             return self.execute_call(node)
         
+        elif node_type == 'LIST':
+            return make_list([self.execute_node(element) for element in node.elements])
+        
+        elif node_type == 'MAP':
+            return self.build_map([self.execute_node(item) for item in node.items])
+        
+        elif node_type == 'INDEX':
+            return self.index_value(self.execute_node(node.target), self.execute_node(node.index))
+        
         return None
     
-    def execute_call(self, node):
-        """Execute a function call"""
-        callee = node['callee']
-        args = [self.execute_node(arg) for arg in node['arguments']]
-        
-        if node['is_builtin']:
-            return self.execute_builtin(callee, args)
-        elif callee in self.functions:
-            return self.execute_user_function(self.functions[callee], args)
-        else:
-            self.error(f"Undefined function: {{callee}}")
+    def define_function(self, node):
+        """Bind a function declaration, invalidating the inline caches on a redefinition"""
+        if self.functions.get(node.name) is not node:
+            self.functions[node.name] = node
+            self.cache_epoch += 1
     
-    def execute_builtin(self, name, args):
-        """Execute built-in function"""
-        # Map custom name to standard function
-        builtin_type = self.builtin_map.get(name, name)
+    def execute_counting_loop(self, node):
+        """Run a loop the optimizer marked as counting over a range
         
-        if builtin_type == 'print':
-            output = ' '.join(str(arg) for arg in args)
-            self.output_buffer.append(output)
-            return None
+        The counter takes each value of the range before the body runs, and
+        the value after the last one once the loop is done, as the last
+        statement of the body would have assigned. Returns UNSET without
+        running anything unless the counter and the bound are ints.
+        """
+        condition = node.condition
+        start = self.execute_node(condition.left)
+        bound = self.execute_node(condition.right)
+        if type(start) is not int or type(bound) is not int:
+            return UNSET
         
-        elif builtin_type == 'input':
-            prompt = args[0] if args else ""
-            return input(str(prompt))
+        step = node.counting_step
+        increment = node.body[-1]
+        body = node.body[:-1]
+        values = range(start, bound + COUNTING_BOUND_ADJUSTMENTS[condition.operator], step)
+        for value in values:
+            self.assign_variable(increment, value)
+            for stmt in body:
+                result = self.execute_node(stmt)
+                if isinstance(result, dict) and result.get('type') == 'RETURN':
+                    return result
+        if values:
+            self.assign_variable(increment, values[-1] + step)
+        return None
+    
+    def execute_binary(self, node, left, right):
+        """Apply a BINARY operator generically, recording the operand types
         
-        elif builtin_type == 'length':
-            if args:
-                return len(str(args[0]))
-            return 0
+        A node that sees the same operand types twice in a row gets the
+        SPECIALIZED_BINARY handler for them, if there is one. A node whose
+        types changed BINARY_FEEDBACK_LIMIT times keeps its handler and stops
+        recording.
+        """
+        operator_name = node.operator
+        specialized_left, specialized_right, handler, observed, misses = node.cache
+        if misses < BINARY_FEEDBACK_LIMIT:
+            types = (type(left), type(right))
+            if types == observed:
+                handler = SPECIALIZED_BINARY.get((operator_name,) + types)
+                if handler is not None:
+                    node.cache = (types[0], types[1], handler, types, misses)
+            else:
+                if observed is not None:
+                    misses += 1
+                node.cache = (specialized_left, specialized_right, handler, types, misses)
         
-        elif builtin_type == 'string':
-            if args:
-                return str(args[0])
-            return ""
+        if operator_name == 'DIVIDE':
+            if right != 0:
+                return left / right
+            self.error("Division by zero")
+        if operator_name == 'AND':
+            return self.is_truthy(left) and self.is_truthy(right)
+        if operator_name == 'OR':
+            return self.is_truthy(left) or self.is_truthy(right)
+        return BINARY_OPERATORS[operator_name](left, right)
+    
+    def execute_call(self, node):
+        """Execute a function call through the inline cache of its call site
         
-        elif builtin_type == 'number':
-            if args:
-                try:
-                    return float(args[0]) if '.' in str(args[0]) else int(args[0])
-                except:
-                    return 0
-            return 0
+        The cache holds the epoch it was filled in, the builtin handler and
+        the user function node; any function declaration that rebinds a name
+        starts a new epoch.
+        """
+        args = [self.execute_node(arg) for arg in node.arguments]
         
-        elif builtin_type == 'random':
-            if len(args) >= 2:
-                return random.randint(int(args[0]), int(args[1]))
-            return random.random()
+        cache = node.cache
+        if cache is None or cache[0] != self.cache_epoch:
+            cache = self.call_target(node)
         
+        if cache[1] is not None:
+            return cache[1](args)
+        return self.execute_user_function(cache[2], args)
+    
+    def call_target(self, node):
+        """Resolve the callee of a CALL node and fill its inline cache for this epoch"""
+        if node.is_builtin:
+            cache = (self.cache_epoch, self.builtin_handler(node.callee), None)
         else:
-            self.error(f"Unknown built-in function: {{name}}")
+            func_node = self.functions.get(node.callee)
+            if func_node is None:
+                self.error(f"Undefined function: {{node.callee}}")
+            cache = (self.cache_epoch, None, func_node)
+        node.cache = cache
+        return cache
+    
+    def builtin_handler(self, name):
+        """The function running the builtin a call site names"""
+        handler = self.builtin_handlers.get(name)
+        if handler is None:
+            def handler(args):
+                self.error(f"Unknown built-in function: {{name}}")
+        return handler
+    
+    def execute_builtin(self, name, args):
+        """Execute built-in function"""
+        return self.builtin_handler(name)(args)
+    
+    def builtin_print(self, args):
+        output = ' '.join(str(arg) for arg in args)
+        self.output.append(output)
+        return None
+    
+    def builtin_input(self, args):
+        prompt = args[0] if args else ""
+        # The prompt must not overtake output a streaming sink still holds
+        self.output.flush()
+        return input(str(prompt))
+    
+    def builtin_length(self, args):
+        if args:
+            if isinstance(args[0], COLLECTION_TYPES):
+                return len(args[0])
+            return len(str(args[0]))
+        return 0
+    
+    def builtin_string(self, args):
+        if args:
+            return str(args[0])
+        return ""
+    
+    def builtin_number(self, args):
+        if args:
+            try:
+                return float(args[0]) if '.' in str(args[0]) else int(args[0])
+            except:
+                return 0
+        return 0
+    
+    def builtin_random(self, args):
+        if len(args) >= 2:
+            return random.randint(int(args[0]), int(args[1]))
+        return random.random()
+    
+    def builtin_range(self, args):
+        # Lazy like Python's: range(end), range(start, end) or range(start, end, step)
+        bounds = [int(arg) for arg in args[:3]]
+        if not bounds:
+            self.error("range needs an end")
+        if len(bounds) == 3 and bounds[2] == 0:
+            self.error("range step cannot be zero")
+        return range(*bounds)
+    
+    # Bulk list builtins: each runs as one pass of C code over the list
+    def builtin_sum(self, args):
+        return sum(self.number_list(args, 'sum'))
+    
+    def builtin_min(self, args):
+        return self.extreme(args, min, 'min')
+    
+    def builtin_max(self, args):
+        return self.extreme(args, max, 'max')
+    
+    def builtin_sort(self, args):
+        items = args[0] if args else None
+        if not isinstance(items, LIST_TYPES):
+            self.error(f"sort needs a list, not {{self.type_name(items)}}")
+        if isinstance(items, NumberList):
+            return type(items)(sorted(items))
+        try:
+            return make_list(sorted(items))
+        except TypeError:
+            self.error("sort needs a list of numbers or of strings")
+    
+    def builtin_map_add(self, args):
+        values = self.number_list(args, 'map_add')
+        other = args[1] if len(args) > 1 else 0
+        if isinstance(other, LIST_TYPES):
+            other = self.number_list([other], 'map_add')
+            if len(other) != len(values):
+                self.error("map_add needs lists of the same length")
+        elif type(other) not in NUMBER_TYPES:
+            self.error(f"map_add cannot add {{self.type_name(other)}}")
+        return vector_add(values, other)
+    
+    def builtin_dot(self, args):
+        left = self.number_list(args[:1], 'dot')
+        right = self.number_list(args[1:2], 'dot')
+        if len(left) != len(right):
+            self.error("dot needs lists of the same length")
+        return sum(map(operator.mul, left, right))
+    
+    def number_list(self, args, name):
+        """The first argument of a bulk builtin, which must be a list of numbers"""
+        values = args[0] if args else None
+        if isinstance(values, NumberList):
+            return values
+        if isinstance(values, list) and all([type(item) in NUMBER_TYPES for item in values]):
+            return values
+        self.error(f"{{name}} needs a list of numbers")
+    
+    def extreme(self, args, choose, name):
+        """min or max of a list argument, or of the arguments themselves"""
+        values = args[0] if len(args) == 1 and isinstance(args[0], LIST_TYPES) else args
+        if not values:
+            self.error(f"{{name}} of an empty list")
+        try:
+            return choose(values)
+        except TypeError:
+            self.error(f"{{name}} needs numbers or strings, not both")
+    
+    # Map builtins: a map is a Python dict, shared by every variable holding it
+    def builtin_get(self, args):
+        """The value of a key, or the default (null unless given) when the map lacks it"""
+        table = self.map_argument(args, 'get')
+        return table.get(self.map_key(args[1] if len(args) > 1 else None), args[2] if len(args) > 2 else None)
+    
+    def builtin_set(self, args):
+        """Store a value under a key, in place, and return the map"""
+        table = self.map_argument(args, 'set')
+        table[self.map_key(args[1] if len(args) > 1 else None)] = args[2] if len(args) > 2 else None
+        return table
+    
+    def builtin_has(self, args):
+        table = self.map_argument(args, 'has')
+        return self.map_key(args[1] if len(args) > 1 else None) in table
+    
+    def builtin_keys(self, args):
+        """The keys of a map, in the order they were first set"""
+        return make_list(map_keys(self.map_argument(args, 'keys')))
+    
+    def map_argument(self, args, name):
+        table = args[0] if args else None
+        if type(table) is not dict:
+            self.error(f"{{name}} needs a map, not {{self.type_name(table)}}")
+        return table
+    
+    def map_key(self, key):
+        """key as a map stores it: lists and maps change, and true would be the same key as 1
+        
+        Floats are wrapped in FloatKey, so 1 and 1.0 are separate keys too.
+        """
+        kind = type(key)
+        if kind is str or kind is int:
+            return key
+        if kind is float:
+            return FloatKey(key)
+        self.error(f"Map key must be a number or string, not {{self.type_name(key)}}")
+    
+    def build_map(self, items):
+        """A map of the keys and values that alternate in items"""
+        table = {{}}
+        for i in range(0, len(items), 2):
+            table[self.map_key(items[i])] = items[i + 1]
+        return table
+    
+    def index_value(self, target, index):
+        """The item of a list, the character of a string, or the value of a map key, at index"""
+        if type(target) is dict:
+            value = target.get(self.map_key(index), UNSET)
+            if value is UNSET:
+                self.error(f"Key {{index!r}} not in map")
+            return value
+        if not isinstance(target, INDEXABLE_TYPES):
+            self.error(f"Cannot index {{self.type_name(target)}}")
+        if type(index) is not int:
+            self.error(f"Index must be a whole number, not {{self.type_name(index)}}")
+        try:
+            return target[index]
+        except IndexError:
+            self.error(f"Index {{index}} out of range")
+    
+    def iterate(self, value):
+        """The items a for loop visits: a range, a list, the characters of a string, or the keys of a map"""
+        if isinstance(value, ITERABLE_TYPES):
+            return value
+        if type(value) is dict:
+            # The body may set keys, which a dict cannot do while iterated
+            return map_keys(value)
+        self.error(f"Cannot iterate over {{self.type_name(value)}}")
+    
+    def type_name(self, value):
+        """The name of a value's type in error messages"""
+        if value is None:
+            return 'null'
+        if isinstance(value, bool):
+            return 'boolean'
+        if isinstance(value, (int, float)):
+            return 'number'
+        if isinstance(value, str):
+            return 'string'
+        if isinstance(value, LIST_TYPES):
+            return 'list'
+        if isinstance(value, dict):
+            return 'map'
+        return type(value).__name__
     
     def execute_user_function(self, func_node, args):
-        """Execute user-defined function"""
-        # Create new scope
-        old_vars = self.variables.copy()
+        """Execute user-defined function, or take its result from the memo table
+        
+        The memo check stays in this method, so each call of the program
+        costs no extra Python frame and deep recursion reaches as far as it
+        can.
+        """
+        key = None
+        if self.memoize and func_node.pure:
+            key, result = self.memo_lookup(func_node, args)
+            if result is not UNSET:
+                return result
+        
+        # Create a new frame
+        frame = [UNSET] * func_node.frame_size
         
         # Bind parameters
-        for i, param in enumerate(func_node['params']):
+        for i, slot in enumerate(func_node.param_slots):
             if i < len(args):
-                self.variables[param] = args[i]
+                frame[slot] = args[i]
             else:
-                self.variables[param] = None
+                frame[slot] = None
         
+        caller_frame = self.frame
+        self.frame = frame
+        self.frames.append((func_node.slot_index, frame))
+        self.call_stack.append(func_node.name)
         # Execute function body
         result = None
-        for stmt in func_node['body']:
+        for stmt in func_node.body:
             stmt_result = self.execute_node(stmt)
             if isinstance(stmt_result, dict) and stmt_result.get('type') == 'RETURN':
                 result = stmt_result['value']
                 break
         
-        # Restore scope
-        self.variables = old_vars
+        # Restore the caller's frame
+        self.call_stack.pop()
+        self.frames.pop()
+        self.frame = caller_frame
         
+        if key is not None:
+            self.memo_table(func_node.name).store(key, result)
         return result
     
+    def memo_lookup(self, func_node, args):
+        """The memo key of a call to a pure function and its cached result, or UNSET
+        
+        The key is None when an argument holds a map; such a call always runs.
+        """
+        key = MemoTable.key(args, len(func_node.params))
+        if key is None:
+            return None, UNSET
+        return key, self.memo_table(func_node.name).lookup(key)
+    
+    def memo_table(self, name):
+        """The result cache of the pure function name"""
+        table = self.memo_tables.get(name)
+        if table is None:
+            table = self.memo_tables[name] = MemoTable(self.memo_size)
+        return table
+    
+    def lookup_variable(self, node):
+        """Read an IDENTIFIER through its resolved frame slot
+        
+        A global read remembers, as the epoch in its inline cache, that no
+        function reads the name dynamically, and then goes to the globals
+        directly.
+        """
+        slot = node.slot
+        if slot is not None:
+            value = self.frame[slot]
+            if value is not UNSET:
+                return value
+        elif node.cache == self.cache_epoch:
+            try:
+                return self.variables[node.value]
+            except KeyError:
+                self.error(f"Undefined variable: {{node.value}}")
+        elif node.value not in self.dynamic_names:
+            node.cache = self.cache_epoch
+        return self.lookup_dynamic(node.value)
+    
+    def lookup_dynamic(self, name):
+        """Read a name from the callers' frames, then from the globals"""
+        if name in self.dynamic_names:
+            for slot_index, frame in reversed(self.frames):
+                slot = slot_index.get(name)
+                if slot is not None and frame[slot] is not UNSET:
+                    return frame[slot]
+        
+        if name in self.variables:
+            return self.variables[name]
+        self.error(f"Undefined variable: {{name}}")
+    
+    def assign_variable(self, node, value):
+        """Store into the frame slot of a local or into the globals"""
+        slot = node.slot
+        if slot is None:
+            self.variables[node.name] = value
+        else:
+            self.frame[slot] = value
+    
+    def clear_hoisted(self, loop, frame):
+        """Forget the hoisted values of a loop as it is entered"""
+        for name, slot in zip(loop.hoisted, loop.hoisted_slots):
+            if slot is None:
+                self.variables.pop(name, None)
+            else:
+                frame[slot] = UNSET
+    
     def is_truthy(self, value):
         """Determine if a value is truthy"""
         if value is None:
@@ -665,99 +1139,549 @@ class {self.language_data['name'].replace(' ', '')}Interpreter:
             return value != 0
         if isinstance(value, str):
             return len(value) > 0
+        if isinstance(value, COLLECTION_TYPES):
+            return len(value) > 0
         return True
     
-    # Parser helper methods
-    def match(self, *types):
-        """Check if current token matches any of the given types"""
-        for token_type in types:
-            if self.check(token_type):
-                self.advance()
-                return True
+    # Parser helper methods. Tokens are kind codes; the EOF sentinel at the
+    # end of the stream never matches a wanted kind, so no bounds checks
+    def match(self, *kinds):
+        """Consume the current token if it has any of the given kinds"""
+        if self.kinds[self.current] in kinds:
+            self.current += 1
+            return True
         return False
     
-    def check(self, token_type):
-        """Check if current token is of given type"""
-        if self.is_at_end():
-            return False
-        return self.peek()['type'] == token_type
+    def check(self, kind):
+        """Check if current token is of given kind"""
+        return self.kinds[self.current] == kind
     
-    def check_type(self, prefix):
-        """Check if current token type starts with prefix"""
-        if self.is_at_end():
-            return False
-        return self.peek()['type'].startswith(prefix)
+    def check_builtin(self):
+        """Check if current token is a builtin name"""
+        return self.kinds[self.current] >= self.lexer.first_builtin
     
     def advance(self):
-        """Consume current token and return it"""
-        if not self.is_at_end():
+        """Consume current token and return its value"""
+        if self.kinds[self.current] != T_EOF:
             self.current += 1
-        return self.previous()
+        return self.values[self.current - 1]
     
     def is_at_end(self):
         """Check if we're at end of tokens"""
-        return self.current >= len(self.tokens)
+        return self.kinds[self.current] == T_EOF
     
     def peek(self):
-        """Return current token without consuming"""
-        if self.is_at_end():
-            return None
-        return self.tokens[self.current]
+        """Return the value of the current token without consuming it"""
+        return self.values[self.current]
     
     def previous(self):
-        """Return previous token"""
-        return self.tokens[self.current - 1]
+        """Return the value of the previous token"""
+        return self.values[self.current - 1]
+    
+    def previous_type(self):
+        """Return the type name of the previous token"""
+        return TOKEN_NAMES[self.kinds[self.current - 1]]
     
-    def consume(self, token_type, message):
-        """Consume token of given type or error"""
-        if self.check(token_type):
-            return self.advance()
+    def consume(self, kind, message):
+        """Consume token of given kind and return its value, or error"""
+        if self.kinds[self.current] == kind:
+            self.current += 1
+            return self.values[self.current - 1]
         
         self.error(message)
     
     def error(self, message):
         """Raise a parser/runtime error"""
-        token = self.peek()
-        if token:
-            raise Exception(f"{{message}} at line {{token['line']}}, column {{token['column']}}")
+        if not self.is_at_end():
+            line, column = self.tokens.position(self.current)
+            raise Exception(f"{{message}} at line {{line}}, column {{column}}")
         else:
             raise Exception(message)
     
     def run_file(self, filename):
         """Run a source file"""
         try:
+            output = self.execute_file(filename)
+            if output:
+                print(output)
+            
+        except FileNotFoundError:
+            print(f"Error: File '{{filename}}' not found")
+        except Exception as e:
+            print(f"Error: {{str(e)}}")
+    
+    def execute_file(self, filename):
+        """Run a source file with the selected engine and return what it printed"""
+        if self.engine == 'python':
             with open(filename, 'r', encoding='utf-8') as f:
                 source = f.read()
+            return self.execute_python(source, filename)
+        
+        # Tokenize straight from the mapped file, without reading it into a string
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+                    ast = self.load_program(source, filename)
+            else:
+                # Empty files cannot be mapped
+                ast = self.load_program(b'', filename)
+        
+        # Execute
+        return self.execute(ast)
+    
+    def run_batch(self, paths):
+        """Run many source files in this process, printing a JSON line for each
+        
+        The language tables are built once. Every file starts from fresh
+        program state, and its output is collected into its JSON line with
+        its status (ok, runtime_error or error) and the seconds it took.
+        The line starts with BATCH_RECORD_PREFIX, which may follow a prompt
+        input() wrote on the same line.
+        """
+        self.output = BufferSink()
+        for filename in self.batch_files(paths):
+            self.reset()
+            started = time.perf_counter()
+            try:
+                output = self.execute_file(filename)
+                error = self.last_error
+                status = 'ok' if error is None else 'runtime_error'
+            except FileNotFoundError:
+                output, error, status = '', f"File '{{filename}}' not found", 'error'
+            except Exception as e:
+                output, error, status = '', str(e), 'error'
             
-            # Tokenize
-            tokens = self.tokenize(source)
+            record = {{'file': filename, 'status': status, 'output': output, 'error': error,
+                      'seconds': round(time.perf_counter() - started, 6)}}
+            print(BATCH_RECORD_PREFIX + json.dumps(record), flush=True)
+    
+    def batch_files(self, paths):
+        """The files named by paths, with directories expanded to the source files below them"""
+        for path in paths:
+            if not os.path.isdir(path):
+                yield path
+                continue
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(name for name in dirs if name != AstCache.DIRECTORY)
+                for name in sorted(files):
+                    if name.endswith(SOURCE_SUFFIX):
+                        yield os.path.join(root, name)
+    
+    def load_program(self, source, filename=None):
+        """Parse source, or take its AST from the parse cache when unchanged"""
+        cache = AstCache(self) if self.use_cache and filename else None
+        if cache is not None:
+            ast = cache.load(source, filename)
+            if ast is not None:
+                return ast
+        
+        ast = self.parse(self.tokenize(source))
+        if cache is not None:
+            cache.store(source, filename, ast)
+        return ast
+    
+    def run_stream(self, filename):
+        """Run a source file one top-level statement at a time"""
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                self.execute_stream(f)
+        except FileNotFoundError:
+            print(f"Error: File '{{filename}}' not found")
+        except Exception as e:
+            print(f"Error: {{str(e)}}")
+    
+    def execute_stream(self, source_file, chunk_size=STREAM_CHUNK_SIZE):
+        """Tokenize, parse and execute a source file incrementally
+        
+        Only whole lines are tokenized. On every refill the lines holding the
+        statements not parsed yet are tokenized again together with the new
+        ones, so the buffer never holds more than one unfinished statement
+        plus one read of input. The parser looks one token ahead, so a
+        statement is complete once it parses without reaching the EOF
+        sentinel of the buffer. Otherwise it is parsed again after reading
+        more input, with the read size doubling until it completes. A parse
+        error anywhere before the sentinel is raised at once.
+        Output is printed after every statement; a runtime error stops the
+        program after printing what came before it.
+        """
+        self.set_tokens(self.lexer.tokenize(''))
+        pending = ''
+        at_end = False
+        read_size = chunk_size
+        
+        while True:
+            while not self.is_at_end():
+                start = self.current
+                try:
+                    stmt = self.parse_statement()
+                except Exception:
+                    # Only running out of buffered tokens can be fixed by reading more
+                    if at_end or self.current != len(self.tokens):
+                        raise
+                    stmt = None
+                
+                if self.current == len(self.tokens) and not at_end:
+                    self.current = start
+                    read_size *= 2
+                    break
+                
+                read_size = chunk_size
+                if stmt is None:
+                    continue
+                for stmt in self.optimize(Program([stmt]), whole_program=False).statements:
+                    if self.execute_statement(stmt):
+                        return
             
-            # Parse
-            ast = self.parse(tokens)
+            if at_end:
+                return
             
-            # Execute
-            output = self.execute(ast)
+            text = pending + source_file.read(read_size)
+            if len(text) == len(pending):
+                at_end = True
+                pending = ''
+            else:
+                cut = text.rfind('\\n') + 1
+                text, pending = text[:cut], text[cut:]
+                if not text:
+                    continue
             
-            if output:
-                print(output)
+            source_lines = self.tokens.source_lines
+            kept_from = source_lines.line_start(self.tokens.offsets[self.current])
+            line = source_lines.first_line + source_lines.source.count('\\n', 0, kept_from)
+            self.set_tokens(self.lexer.tokenize(source_lines.source[kept_from:] + text, line))
+    
+    def execute_statement(self, stmt):
+        """Resolve and execute one top-level statement, flushing its output
+        
+        Returns True when the program should stop: after a top-level
+        return or a runtime error.
+        """
+        known_names = len(self.dynamic_names)
+        self.resolve(stmt)
+        if len(self.dynamic_names) != known_names:
+            # Function bodies compiled before may read a name that has just
+            # become dynamic; compile them again on their next call
+            self.compiled_bodies.clear()
+            self.cache_epoch += 1
+        if self.memo_tables and not self.function_declarations(stmt).keys().isdisjoint(self.functions):
+            # A pure function declared earlier may call the one redefined here
+            self.memo_tables.clear()
+        
+        try:
+            if self.engine == 'tree':
+                result = self.execute_node(stmt)
+                stop = isinstance(result, dict) and result.get('type') == 'RETURN'
+            else:
+                stop = self.compile_statement(stmt)(None) is not None
+        except Exception as e:
+            self.output.append(f"Runtime error: {{str(e)}}")
+            stop = True
+        
+        output = self.output_text()
+        if output:
+            print(output)
+        self.output.clear()
+        return stop
+    
+    def execute_python(self, source, filename=None):
+        """Run source as translated Python, reusing the cached code object when current"""
+        backend = PythonBackend(self)
+        code = backend.load_cached(source, filename) if self.use_cache else None
+        
+        if code is None:
+            ast = self.parse(self.tokenize(source))
+            try:
+                code = backend.compile(ast, source, filename)
+            except (NotImplementedError, SyntaxError, RecursionError):
+                # Falls back to the closure engine, also for expressions too deep for compile()
+                return self.execute(ast)
+        
+        return backend.run(code)
+    
+    def run_vm(self, ast):
+        """Run the AST on the bytecode VM, or the closure engine if it cannot be lowered"""
+        try:
+            code = BytecodeCompiler(self.builtin_map, self.dynamic_names, self.memoize).compile(ast)
+        except NotImplementedError:
+            self.compile_program(ast)()
+            return
+        VirtualMachine(self).run(code)
+    
+    def disassemble_file(self, filename):
+        """Print the bytecode the vm engine emits for a source file"""
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                source = f.read()
+            
+            ast = self.parse(self.tokenize(source))
+            print(disassemble(BytecodeCompiler(self.builtin_map, self.dynamic_names, self.memoize).compile(ast)))
             
         except FileNotFoundError:
             print(f"Error: File '{{filename}}' not found")
         except Exception as e:
             print(f"Error: {{str(e)}}")
-
+    
+    def run_profiled(self, filename, report_file):
+        """Run a source file under the deterministic profiler
+        
+        The report goes to stderr as tables and to report_file as JSON.
+        """
+        if self.engine in ('vm', 'python'):
+            # Only the tree-walker and the closure compiler are instrumented
+            self.engine = 'closure'
+        # Statement lines are recorded by the parser, so cached programs lack them
+        self.use_cache = False
+        # A counting loop steps its variable natively, so the line of its
+        # increment would never be hit
+        self.optimizer.passes = self.optimizer.passes - {{'counting_loops'}}
+        
+        profiler = Profiler()
+        self.install_profiler(profiler)
+        profiler.enter(Profiler.PROGRAM)
+        try:
+            self.run_file(filename)
+        finally:
+            profiler.leave()
+        
+        print(profiler.format_table(), file=sys.stderr)
+        try:
+            with open(report_file, 'w', encoding='utf-8') as f:
+                json.dump(profiler.to_dict(), f, indent=2)
+        except OSError as e:
+            print(f"Error: {{str(e)}}")
+    
+    def run_sampled(self, filename, output_prefix, interval):
+        """Run a source file while a SamplingProfiler records its call stack
+        
+        Writes output_prefix.folded, for flame graph tools, and
+        output_prefix.trace.json, for chrome://tracing and Perfetto.
+        """
+        sampler = SamplingProfiler(self.call_stack, interval)
+        sampler.start()
+        try:
+            self.run_file(filename)
+        finally:
+            sampler.stop()
+        
+        try:
+            with open(output_prefix + '.folded', 'w', encoding='utf-8') as f:
+                f.write(sampler.folded())
+            with open(output_prefix + '.trace.json', 'w', encoding='utf-8') as f:
+                json.dump(sampler.chrome_trace(), f)
+        except OSError as e:
+            print(f"Error: {{str(e)}}")
+            return
+        print(f"{{len(sampler.samples)}} samples written to {{output_prefix}}.folded and {{output_prefix}}.trace.json",
+              file=sys.stderr)
+    
+    def install_profiler(self, profiler):
+        """Wrap the parser, tree-walker and closure compiler so that they report to profiler
+        
+        The wrappers are instance attributes shadowing the methods, so
+        a run without --profile executes exactly the same code as before.
+        """
+        node_counts = profiler.node_counts
+        line_hits = profiler.line_hits
+        enter = profiler.enter
+        leave = profiler.leave
+        node_lines = {{}}
+        # Parsed statements stay referenced so that their ids are not reused
+        statements = []
+        
+        parse_statement = self.parse_statement
+        def located_parse_statement():
+            start = self.current
+            stmt = parse_statement()
+            if stmt is not None:
+                statements.append(stmt)
+                node_lines[id(stmt)] = self.tokens.position(start)[0]
+            return stmt
+        self.parse_statement = located_parse_statement
+        
+        execute_node = self.execute_node
+        def profiled_execute_node(node):
+            if node is not None:
+                node_counts[node.type] = node_counts.get(node.type, 0) + 1
+                line = node_lines.get(id(node))
+                if line is not None:
+                    line_hits[line] = line_hits.get(line, 0) + 1
+            return execute_node(node)
+        self.execute_node = profiled_execute_node
+        
+        def profile_compiler(compile_node):
+            def profiled_compile(node):
+                run = compile_node(node)
+                node_type = node.type
+                line = node_lines.get(id(node))
+                def profiled_run(frame):
+                    node_counts[node_type] = node_counts.get(node_type, 0) + 1
+                    if line is not None:
+                        line_hits[line] = line_hits.get(line, 0) + 1
+                    return run(frame)
+                return profiled_run
+            return profiled_compile
+        self.compile_statement = profile_compiler(self.compile_statement)
+        self.compile_expression = profile_compiler(self.compile_expression)
+        
+        def profile_calls(call):
+            def profiled_call(func_node, args):
+                enter(func_node.name)
+                try:
+                    return call(func_node, args)
+                finally:
+                    leave()
+            return profiled_call
+        self.execute_user_function = profile_calls(self.execute_user_function)
+        self.call_compiled_function = profile_calls(self.call_compiled_function)
+    
+    def print_memo_stats(self):
+        """Report to stderr how well the memo table of each pure function worked"""
+        for name, table in self.memo_tables.items():
+            print(f"memo {{name}}: {{table.hits}} hits, {{table.misses}} misses, {{len(table.entries)}} entries",
+                  file=sys.stderr)
+    
+    def print_optimizer_stats(self):
+        """Report to stderr how many nodes each optimizer pass rewrote"""
+        if self.use_optimizer:
+            counts = ', '.join(f"{{name}} {{count}}" for name, count in self.optimizer.stats.items())
+            print(f"optimizer: {{counts}}", file=sys.stderr)
+    
+    def dump_file(self, filename):
+        """Print the AST of a source file as it reaches the engines, and what the optimizer did"""
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                source = f.read()
+            
+            ast = self.parse(self.tokenize(source))
+            print(json.dumps(node_to_dict(ast), indent=2))
+            self.print_optimizer_stats()
+            
+        except FileNotFoundError:
+            print(f"Error: File '{{filename}}' not found")
+        except Exception as e:
+            print(f"Error: {{str(e)}}")
+{self._generate_resolver()}
+{self._generate_closure_compiler()}
 def main():
     """Main entry point"""
     if len(sys.argv) < 2:
-        print(f"Usage: python {lang_name}.py <filename.{lang_name[:3]}>")
+        print(f"Usage: python {lang_name}.py [--engine={{'|'.join(ENGINES)}}] [--stream] <filename.{lang_name[:3]}>")
+        print(f"       python {lang_name}.py --batch <file or directory>...")
         print(f"\\nExample: python {lang_name}.py examples/hello.{lang_name[:3]}")
         return
     
-    interpreter = {self.language_data['name'].replace(' ', '')}Interpreter()
-    interpreter.run_file(sys.argv[1])
+    parser = argparse.ArgumentParser(description={(self.language_data['name'] + ' interpreter')!r})
+    parser.add_argument('filenames', nargs='+', metavar='filename')
+    parser.add_argument('--batch', action='store_true',
+                        help='run every file given, and the source files in every directory given, '
+                             'printing one JSON line of output, status and timing per file')
+    parser.add_argument('--engine', choices=ENGINES, default='closure',
+                        help='execution engine (tree is the reference tree-walker; '
+                             'vm keeps calls off the Python stack and runs tail calls in constant space)')
+    parser.add_argument('--disassemble', action='store_true',
+                        help='print the bytecode of the vm engine instead of running')
+    parser.add_argument('--no-optimize', action='store_true',
+                        help='run the program as parsed, without constant folding or dead code removal')
+    parser.add_argument('--disable-pass', action='append', choices=Optimizer.PASSES, default=[],
+                        help='skip one optimizer pass (may be given more than once)')
+    parser.add_argument('--optimizer-stats', action='store_true',
+                        help='report to stderr how many nodes each optimizer pass rewrote')
+    parser.add_argument('--memoize', action='store_true',
+                        help='cache the results of pure functions (also enabled by the memoize feature)')
+    parser.add_argument('--memo-size', type=int, default=MemoTable.MAX_SIZE,
+                        help='results kept per pure function before the least recently used are dropped')
+    parser.add_argument('--memo-stats', action='store_true',
+                        help='report the hits and misses of each pure function to stderr')
+    parser.add_argument('--output', choices=OUTPUT_SINKS, default='buffer',
+                        help='where print goes: buffer prints everything at exit, stream writes as the '
+                             'program runs, ring keeps only the last --ring-size lines')
+    parser.add_argument('--flush-lines', type=int, default=StreamSink.FLUSH_LINES,
+                        help='lines --output=stream collects before writing them')
+    parser.add_argument('--flush-bytes', type=int, default=StreamSink.FLUSH_BYTES,
+                        help='characters --output=stream collects before writing them')
+    parser.add_argument('--ring-size', type=int, default=RingBufferSink.MAX_LINES,
+                        help='lines --output=ring keeps')
+    parser.add_argument('--profile', action='store_true',
+                        help='count node evaluations, function calls and line hits and time the functions '
+                             '(tree or closure engine; vm and python run as closure)')
+    parser.add_argument('--profile-output', metavar='FILE',
+                        help='where --profile writes its JSON report (default: next to the source file)')
+    parser.add_argument('--sample', action='store_true',
+                        help='sample the call stack while running and write folded stacks and a Chrome trace')
+    parser.add_argument('--sample-interval', type=float, default=SamplingProfiler.INTERVAL * 1000, metavar='MS',
+                        help='milliseconds between two samples of --sample')
+    parser.add_argument('--sample-output', metavar='PREFIX',
+                        help='path prefix of the --sample files (default: the source file without its suffix)')
+    parser.add_argument('--dump-ast', action='store_true',
+                        help='print the optimized AST as JSON instead of running')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='always parse, without reading or writing __slangcache__ or the compiled code cache')
+    parser.add_argument('--stream', action='store_true',
+                        help='parse and run one top-level statement at a time (tree or closure engine; '
+                             'vm and python run as closure)')
+    args = parser.parse_args()
+    if len(args.filenames) > 1 and not args.batch:
+        parser.error('more than one file needs --batch')
+    
+    if args.output == 'stream':
+        output = StreamSink(sys.stdout, args.flush_lines, args.flush_bytes)
+    elif args.output == 'ring':
+        output = RingBufferSink(args.ring_size)
+    else:
+        output = BufferSink()
+    interpreter = {self.language_data['name'].replace(' ', '')}Interpreter(engine=args.engine, use_cache=not args.no_cache,
+                                                                     use_optimizer=not args.no_optimize,
+                                                                     disabled_passes=args.disable_pass,
+                                                                     memoize=args.memoize, memo_size=args.memo_size,
+                                                                     output=output)
+    filename = args.filenames[0]
+    if args.batch:
+        interpreter.run_batch(args.filenames)
+    elif args.disassemble:
+        interpreter.disassemble_file(filename)
+    elif args.dump_ast:
+        interpreter.dump_file(filename)
+    elif args.profile:
+        interpreter.run_profiled(filename, args.profile_output or os.path.splitext(filename)[0] + '.profile.json')
+    elif args.sample:
+        interpreter.run_sampled(filename, args.sample_output or os.path.splitext(filename)[0],
+                                args.sample_interval / 1000)
+    elif args.stream:
+        interpreter.run_stream(filename)
+    else:
+        interpreter.run_file(filename)
+    if args.optimizer_stats and not args.dump_ast:
+        interpreter.print_optimizer_stats()
+    if args.memo_stats:
+        interpreter.print_memo_stats()
+
+def run_with_deep_stack(function):
+    """Run function on a thread with room for deep recursion, returning its exit status
+    
+    A call of the program takes a few Python frames in the tree, closure
+    and python engines, so the default limits would stop recursion a few
+    hundred calls deep. The vm engine does not need this.
+    """
+    status = []
+    
+    def target():
+        try:
+            function()
+            status.append(0)
+        except SystemExit as e:
+            status.append(e.code)
+    
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    default_size = threading.stack_size(THREAD_STACK_SIZE)
+    thread = threading.Thread(target=target)
+    thread.start()
+    # Threads started later, such as the sampling profiler, get the default
+    threading.stack_size(default_size)
+    thread.join()
+    return status[0] if status else 1
 
 if __name__ == "__main__":
-    main()
+    sys.exit(run_with_deep_stack(main))
 '''
         
         # Write the interpreter file
@@ -765,9 +1689,3193 @@ if __name__ == "__main__":
             f.write(interpreter_code)
         
         return interpreter_file
-
-class CodeExecutor:
-    """Handles code execution and simulation in the playground"""
+    
+    def _generate_lexer(self):
+        """Generate the table-driven lexer built once per language definition"""
+        return r'''
+# Token kinds with a fixed meaning in every language; each Lexer appends the
+# KEYWORD_* and BUILTIN_* kinds of its own language definition after these
+TOKEN_NAMES = [
+    'EOF', 'IDENTIFIER', 'NUMBER', 'STRING', 'TRUE', 'FALSE',
+    'PLUS', 'MINUS', 'MULTIPLY', 'DIVIDE', 'ASSIGN',
+    'EQUALS', 'NOT_EQUALS', 'LESS', 'GREATER', 'LESS_EQUAL', 'GREATER_EQUAL', 'AND', 'OR',
+    'LPAREN', 'RPAREN', 'LBRACE', 'RBRACE', 'LBRACKET', 'RBRACKET', 'COMMA', 'COLON',
+]
+(T_EOF, T_IDENTIFIER, T_NUMBER, T_STRING, T_TRUE, T_FALSE,
+ T_PLUS, T_MINUS, T_MULTIPLY, T_DIVIDE, T_ASSIGN,
+ T_EQUALS, T_NOT_EQUALS, T_LESS, T_GREATER, T_LESS_EQUAL, T_GREATER_EQUAL, T_AND, T_OR,
+ T_LPAREN, T_RPAREN, T_LBRACE, T_RBRACE, T_LBRACKET, T_RBRACKET, T_COMMA, T_COLON) = range(len(TOKEN_NAMES))
+
+# Kind of a keyword the language definition leaves out; no token has it
+T_NONE = -1
+
+
+class SourceLines:
+    """Maps offsets in a source buffer to lines and columns
+    
+    The source is a str or a bytes-like buffer of UTF-8 such as an mmap. The
+    index of newline offsets is only built the first time a position is
+    asked for, which for most runs is never.
+    """
+    
+    __slots__ = ('source', 'first_line', 'starts')
+    
+    def __init__(self, source, first_line=1):
+        self.source = source
+        self.first_line = first_line
+        self.starts = None
+    
+    def build(self):
+        """Record the offset every line starts at"""
+        source = self.source
+        newline = '\n' if isinstance(source, str) else b'\n'
+        starts = array('q', [0])
+        offset = source.find(newline)
+        while offset != -1:
+            starts.append(offset + 1)
+            offset = source.find(newline, offset + 1)
+        self.starts = starts
+    
+    def position(self, offset):
+        """Return the line and the 0-based column of an offset"""
+        if self.starts is None:
+            self.build()
+        index = bisect_right(self.starts, offset) - 1
+        start = self.starts[index]
+        if isinstance(self.source, str):
+            column = offset - start
+        else:
+            column = len(self.source[start:offset].decode('utf-8', 'replace'))
+        return self.first_line + index, column
+    
+    def line_start(self, offset):
+        """Return the offset of the start of the line holding offset"""
+        if isinstance(self.source, str):
+            return self.source.rfind('\n', 0, offset) + 1
+        return self.source.rfind(b'\n', 0, offset) + 1
+
+
+class TokenStream:
+    """Tokens stored as parallel arrays of kind codes, values and source offsets
+    
+    The last entry is always an EOF sentinel, so a parser can look at the
+    current kind without checking for the end of the stream first. Lines and
+    columns come from the offsets on demand. Indexing and iteration still
+    produce the classic token dicts for tools that want them; len() does not
+    count the sentinel.
+    """
+    
+    __slots__ = ('kinds', 'values', 'offsets', 'source_lines', 'kind_names')
+    
+    def __init__(self, kinds, values, offsets, source_lines, kind_names):
+        self.kinds = kinds
+        self.values = values
+        self.offsets = offsets
+        self.source_lines = source_lines
+        self.kind_names = kind_names
+    
+    def __len__(self):
+        return len(self.kinds) - 1
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        line, column = self.position(index)
+        return {'type': self.kind_names[self.kinds[index]], 'value': self.values[index],
+                'line': line, 'column': column}
+    
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+    
+    def position(self, index):
+        """Return the line and column of the token at index"""
+        return self.source_lines.position(self.offsets[index])
+
+
+class Lexer:
+    """Scans a whole source buffer with one master pattern built from a language definition"""
+    
+    TOKEN_PATTERNS = [
+        ('COMMENT', r'^[^\S\n]*#[^\n]*'),
+        ('STRING', r'"(?:[^"\\\n]|\\.)*"' + '|' + r"'(?:[^'\\\n]|\\.)*'"),
+        ('WORD', r'[a-zA-Z_][a-zA-Z0-9_]*'),
+        ('NUMBER', r'[0-9]+\.?[0-9]*'),
+        ('OP', r'==|!=|<=|>=|&&|\|\||[+\-*/=<>(){}\[\],:]'),
+    ]
+    
+    OPERATORS = [
+        ('addition', '+', 'PLUS'),
+        ('subtraction', '-', 'MINUS'),
+        ('multiplication', '*', 'MULTIPLY'),
+        ('division', '/', 'DIVIDE'),
+        ('assign', '=', 'ASSIGN'),
+        ('equal', '==', 'EQUALS'),
+        ('not_equal', '!=', 'NOT_EQUALS'),
+        ('less_than', '<', 'LESS'),
+        ('greater_than', '>', 'GREATER'),
+        ('less_equal', '<=', 'LESS_EQUAL'),
+        ('greater_equal', '>=', 'GREATER_EQUAL'),
+        ('and', '&&', 'AND'),
+        ('or', '||', 'OR'),
+    ]
+    
+    DELIMITERS = {
+        '(': 'LPAREN', ')': 'RPAREN',
+        '{': 'LBRACE', '}': 'RBRACE',
+        '[': 'LBRACKET', ']': 'RBRACKET',
+        ',': 'COMMA', ':': 'COLON'
+    }
+    
+    WORD_OR_NUMBER = re.compile(r'[a-zA-Z_][a-zA-Z0-9_]*|[0-9]+\.?[0-9]*')
+    NUMBER = re.compile(r'[0-9]+\.?[0-9]*')
+    
+    def __init__(self, lang_def):
+        keywords = lang_def.get('keywords', {})
+        if keywords.get('for') and not keywords.get('in'):
+            # A for loop needs the word between its variable and its iterable
+            keywords = {**keywords, 'in': 'in'}
+        builtins = lang_def.get('builtins', {})
+        custom_operators = lang_def.get('operators', {})
+        
+        # Number the kinds of this language: the fixed ones, then keywords,
+        # then builtins, so every kind from first_builtin on is a builtin
+        self.kind_names = list(TOKEN_NAMES)
+        self.kind_ids = {name: kind for kind, name in enumerate(self.kind_names)}
+        for text in keywords:
+            self.add_kind(f'KEYWORD_{text.upper()}')
+        self.first_builtin = len(self.kind_names)
+        for text in builtins:
+            self.add_kind(f'BUILTIN_{text.upper()}')
+        kind_ids = self.kind_ids
+        
+        operators = {}
+        for key, default, name in self.OPERATORS:
+            operators[custom_operators.get(key, default)] = kind_ids[name]
+        
+        # Keywords and builtins win over every other classification, even
+        # for text that scans as a string or a number
+        self.reserved = {}
+        for text, name in builtins.items():
+            if name:
+                self.reserved[name] = kind_ids[f'BUILTIN_{text.upper()}']
+        for text, name in keywords.items():
+            if name:
+                self.reserved[name] = kind_ids[f'KEYWORD_{text.upper()}']
+        
+        # Later entries win, so go from the lowest priority to the highest
+        self.kinds = {builtins.get('false', 'false'): T_FALSE}
+        self.kinds[builtins.get('true', 'true')] = T_TRUE
+        self.kinds.update((text, kind_ids[name]) for text, name in self.DELIMITERS.items())
+        self.kinds.update(operators)
+        self.kinds.update(self.reserved)
+        
+        # Symbolic custom spellings such as ** or <> are scanned as one token;
+        # word spellings scan as WORD and are classified through the table
+        patterns = list(self.TOKEN_PATTERNS)
+        symbolic = sorted((text for text in operators if text and not self.WORD_OR_NUMBER.fullmatch(text)),
+                          key=len, reverse=True)
+        if symbolic:
+            patterns.insert(1, ('CUSTOM_OP', '|'.join(re.escape(text) for text in symbolic)))
+        
+        master = '|'.join(f'(?P<{name}>{regex})' for name, regex in patterns)
+        self.pattern = re.compile(master, re.MULTILINE)
+        self.buffer_pattern = re.compile(master.encode('utf-8'), re.MULTILINE)
+    
+    def add_kind(self, name):
+        """Give a new kind code to name unless it already has one"""
+        if name not in self.kind_ids:
+            self.kind_ids[name] = len(self.kind_names)
+            self.kind_names.append(name)
+    
+    def classify(self, text):
+        """Return the token type of a single piece of source text"""
+        if text in self.reserved:
+            kind = self.reserved[text]
+        elif text.startswith('"') or text.startswith("'"):
+            kind = T_STRING
+        elif self.NUMBER.fullmatch(text):
+            kind = T_NUMBER
+        else:
+            kind = self.kinds.get(text, T_IDENTIFIER)
+        return self.kind_names[kind]
+    
+    def tokenize(self, code, line=1):
+        """Scan code in one pass, skipping whitespace, comment lines and unknown characters
+        
+        code is a str or a bytes-like buffer of UTF-8 such as an mmap. It must
+        start at the beginning of a line; line is the number of that line.
+        """
+        if not isinstance(code, str):
+            return self.tokenize_buffer(code, line)
+        
+        kinds = array('H')
+        values = []
+        offsets = array('q')
+        add_kind = kinds.append
+        add_value = values.append
+        add_offset = offsets.append
+        kind_of = self.kinds.get
+        reserved = self.reserved
+        intern = sys.intern
+        
+        for match in self.pattern.finditer(code):
+            group = match.lastgroup
+            if group == 'COMMENT':
+                continue
+            
+            value = match.group()
+            if group == 'STRING':
+                kind = reserved.get(value, T_STRING)
+            elif group == 'NUMBER':
+                kind = reserved.get(value, T_NUMBER)
+            else:
+                # Names and operators repeat a lot; share one string per spelling
+                value = intern(value)
+                kind = kind_of(value, T_IDENTIFIER)
+            
+            add_kind(kind)
+            add_value(value)
+            add_offset(match.start())
+        
+        add_kind(T_EOF)
+        add_value('')
+        add_offset(len(code))
+        return TokenStream(kinds, values, offsets, SourceLines(code, line), self.kind_names)
+    
+    def tokenize_buffer(self, buffer, line=1):
+        """Scan a UTF-8 buffer in place, decoding only the text of each token"""
+        kinds = array('H')
+        values = []
+        offsets = array('q')
+        add_kind = kinds.append
+        add_value = values.append
+        add_offset = offsets.append
+        kind_of = self.kinds.get
+        reserved = self.reserved
+        intern = sys.intern
+        spellings = {}
+        
+        for match in self.buffer_pattern.finditer(buffer):
+            group = match.lastgroup
+            if group == 'COMMENT':
+                continue
+            
+            raw = match.group()
+            if group == 'STRING':
+                value = raw.decode('utf-8')
+                kind = reserved.get(value, T_STRING)
+            elif group == 'NUMBER':
+                value = raw.decode('ascii')
+                kind = reserved.get(value, T_NUMBER)
+            else:
+                # Decode and classify each distinct name or operator once
+                entry = spellings.get(raw)
+                if entry is None:
+                    value = intern(raw.decode('utf-8'))
+                    entry = spellings[raw] = (value, kind_of(value, T_IDENTIFIER))
+                value, kind = entry
+            
+            add_kind(kind)
+            add_value(value)
+            add_offset(match.start())
+        
+        add_kind(T_EOF)
+        add_value('')
+        add_offset(len(buffer))
+        return TokenStream(kinds, values, offsets, SourceLines(buffer, line), self.kind_names)
+'''
+    
+    def _generate_ast_nodes(self):
+        """Generate the __slots__ AST node classes and the dict converters"""
+        return r'''
+class Node:
+    """Base class of AST nodes
+    
+    type is the node type name used for dispatch, fields are the parser
+    fields in constructor order, child_fields the subset holding child
+    nodes or lists of them, and annotations the fields the resolver fills in.
+    The cache slot of CALL, IDENTIFIER and BINARY nodes is the inline cache
+    of the tree-walker; it is filled in at run time and not part of the dict
+    format.
+    """
+    
+    __slots__ = ()
+    type = None
+    fields = ()
+    child_fields = ()
+    annotations = ()
+    
+    def __repr__(self):
+        args = ', '.join(f'{field}={getattr(self, field)!r}' for field in self.fields)
+        return f'{self.__class__.__name__}({args})'
+
+
+class Program(Node):
+    __slots__ = ('statements',)
+    type = 'PROGRAM'
+    fields = child_fields = ('statements',)
+    
+    def __init__(self, statements):
+        self.statements = statements
+
+
+class VarDecl(Node):
+    __slots__ = ('name', 'value', 'slot')
+    type = 'VAR_DECL'
+    fields = ('name', 'value')
+    child_fields = ('value',)
+    annotations = ('slot',)
+    
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+        self.slot = None
+
+
+class FuncDecl(Node):
+    __slots__ = ('name', 'params', 'body', 'slot_index', 'frame_size', 'param_slots', 'free_reads', 'pure')
+    type = 'FUNC_DECL'
+    fields = ('name', 'params', 'body')
+    child_fields = ('body',)
+    annotations = ('slot_index', 'frame_size', 'param_slots', 'free_reads', 'pure')
+    
+    def __init__(self, name, params, body):
+        self.name = name
+        self.params = params
+        self.body = body
+        self.slot_index = None
+        self.frame_size = 0
+        self.param_slots = None
+        self.free_reads = ()
+        self.pure = False
+
+
+class If(Node):
+    __slots__ = ('condition', 'then_branch', 'else_branch')
+    type = 'IF_STMT'
+    fields = child_fields = ('condition', 'then_branch', 'else_branch')
+    
+    def __init__(self, condition, then_branch, else_branch):
+        self.condition = condition
+        self.then_branch = then_branch
+        self.else_branch = else_branch
+
+
+class Loop(Node):
+    __slots__ = ('condition', 'body', 'hoisted', 'hoisted_slots', 'counting_step')
+    type = 'LOOP_STMT'
+    fields = child_fields = ('condition', 'body')
+    annotations = ('hoisted', 'hoisted_slots', 'counting_step')
+    
+    def __init__(self, condition, body):
+        self.condition = condition
+        self.body = body
+        self.hoisted = ()
+        self.hoisted_slots = ()
+        self.counting_step = None
+
+
+class For(Node):
+    __slots__ = ('name', 'iterable', 'body', 'slot')
+    type = 'FOR_STMT'
+    fields = ('name', 'iterable', 'body')
+    child_fields = ('iterable', 'body')
+    annotations = ('slot',)
+    
+    def __init__(self, name, iterable, body):
+        self.name = name
+        self.iterable = iterable
+        self.body = body
+        self.slot = None
+
+
+class Return(Node):
+    __slots__ = ('value',)
+    type = 'RETURN_STMT'
+    fields = child_fields = ('value',)
+    
+    def __init__(self, value):
+        self.value = value
+
+
+class ExprStmt(Node):
+    __slots__ = ('expression',)
+    type = 'EXPR_STMT'
+    fields = child_fields = ('expression',)
+    
+    def __init__(self, expression):
+        self.expression = expression
+
+
+class Assign(Node):
+    __slots__ = ('name', 'value', 'slot')
+    type = 'ASSIGN'
+    fields = ('name', 'value')
+    child_fields = ('value',)
+    annotations = ('slot',)
+    
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+        self.slot = None
+
+
+class Binary(Node):
+    __slots__ = ('left', 'operator', 'right', 'cache')
+    type = 'BINARY'
+    fields = ('left', 'operator', 'right')
+    child_fields = ('left', 'right')
+    
+    def __init__(self, left, operator, right):
+        self.left = left
+        self.operator = operator
+        self.right = right
+        self.cache = NO_TYPE_FEEDBACK
+
+
+class Unary(Node):
+    __slots__ = ('operator', 'operand')
+    type = 'UNARY'
+    fields = ('operator', 'operand')
+    child_fields = ('operand',)
+    
+    def __init__(self, operator, operand):
+        self.operator = operator
+        self.operand = operand
+
+
+class Call(Node):
+    __slots__ = ('callee', 'arguments', 'is_builtin', 'cache')
+    type = 'CALL'
+    fields = ('callee', 'arguments', 'is_builtin')
+    child_fields = ('arguments',)
+    
+    def __init__(self, callee, arguments, is_builtin):
+        self.callee = callee
+        self.arguments = arguments
+        self.is_builtin = is_builtin
+        self.cache = None
+
+
+class Literal(Node):
+    __slots__ = ('value',)
+    type = 'LITERAL'
+    fields = ('value',)
+    
+    def __init__(self, value):
+        self.value = value
+
+
+class ListLiteral(Node):
+    __slots__ = ('elements',)
+    type = 'LIST'
+    fields = child_fields = ('elements',)
+    
+    def __init__(self, elements):
+        self.elements = elements
+
+
+class MapLiteral(Node):
+    __slots__ = ('items',)
+    type = 'MAP'
+    fields = child_fields = ('items',)
+    
+    def __init__(self, items):
+        # Keys and values alternate, in the order they are evaluated
+        self.items = items
+
+
+class Index(Node):
+    __slots__ = ('target', 'index')
+    type = 'INDEX'
+    fields = child_fields = ('target', 'index')
+    
+    def __init__(self, target, index):
+        self.target = target
+        self.index = index
+
+
+class Hoisted(Node):
+    """A loop-invariant expression computed once per entry into its loop
+    
+    The value is kept in the hidden variable name, which the loop clears
+    when it is entered. Only the optimizer creates these nodes.
+    """
+    
+    __slots__ = ('name', 'expression', 'slot')
+    type = 'HOISTED'
+    fields = ('name', 'expression')
+    child_fields = ('expression',)
+    annotations = ('slot',)
+    
+    def __init__(self, name, expression):
+        self.name = name
+        self.expression = expression
+        self.slot = None
+
+
+class Identifier(Node):
+    __slots__ = ('value', 'slot', 'cache')
+    type = 'IDENTIFIER'
+    fields = ('value',)
+    annotations = ('slot',)
+    
+    def __init__(self, value):
+        self.value = value
+        self.slot = None
+        self.cache = None
+
+
+NODE_CLASSES = {cls.type: cls for cls in (Program, VarDecl, FuncDecl, If, Loop, For, Return, ExprStmt,
+                                          Assign, Binary, Unary, Call, Literal, ListLiteral, MapLiteral, Index,
+                                          Hoisted, Identifier)}
+
+# Values a for loop iterates over
+ITERABLE_TYPES = (range, str) + LIST_TYPES
+
+def iter_child_nodes(node):
+    """Yield the direct child nodes of an AST node"""
+    for field in node.child_fields:
+        value = getattr(node, field)
+        if isinstance(value, list):
+            yield from value
+        elif value is not None:
+            yield value
+
+def node_to_dict(node):
+    """Convert an AST node tree to the plain dict format, resolver annotations included"""
+    if isinstance(node, list):
+        return [node_to_dict(item) for item in node]
+    if not isinstance(node, Node):
+        return node
+    
+    data = {'type': node.type}
+    for field in node.fields:
+        value = getattr(node, field)
+        data[field] = node_to_dict(value) if field in node.child_fields else value
+    for field in node.annotations:
+        data[field] = getattr(node, field)
+    return data
+
+def node_from_dict(data):
+    """Build an AST node tree from the plain dict format"""
+    if isinstance(data, list):
+        return [node_from_dict(item) for item in data]
+    if not isinstance(data, dict):
+        return data
+    
+    cls = NODE_CLASSES[data['type']]
+    args = []
+    for field in cls.fields:
+        value = data.get(field)
+        args.append(node_from_dict(value) if field in cls.child_fields else value)
+    node = cls(*args)
+    for field in cls.annotations:
+        if field in data:
+            setattr(node, field, data[field])
+    return node
+
+'''
+    
+    def _generate_resolver(self):
+        """Generate the resolver pass that assigns frame slots to locals"""
+        return r'''
+    # Resolver: every name a function binds (parameters, VAR_DECL, ASSIGN, FOR_STMT)
+    # gets a (depth 0, slot) address in that function's fixed-size frame and
+    # everything else is a global. Blocks do not open scopes and functions
+    # do not capture, so no deeper addresses exist. A slot that is still
+    # UNSET falls back to the callers' frames and then the globals, which
+    # keeps the copy-on-call dynamic scoping of the original interpreter.
+    BINDING_NODES = frozenset(['VAR_DECL', 'ASSIGN', 'FOR_STMT', 'HOISTED'])
+    
+    def resolve(self, ast):
+        """Annotate the AST with frame slots for function locals and mark its pure functions"""
+        self.resolve_node(ast, None)
+        self.mark_pure_functions(ast)
+        return ast
+    
+    def resolve_function(self, node):
+        """Lay out the frame of a FUNC_DECL and resolve its body"""
+        slots = {}
+        for param in node.params:
+            slots.setdefault(param, len(slots))
+        for stmt in node.body:
+            self.collect_locals(stmt, slots)
+        
+        node.slot_index = slots
+        node.frame_size = len(slots)
+        node.param_slots = [slots[param] for param in node.params]
+        self.dynamic_names.update(slots)
+        free_reads = set()
+        self.collect_free_reads(node.body, set(node.params), free_reads)
+        node.free_reads = tuple(sorted(free_reads))
+        
+        for stmt in node.body:
+            self.resolve_node(stmt, slots)
+    
+    def collect_free_reads(self, statements, assigned, free_reads):
+        """Add the names a function body may look up outside its own frame to free_reads
+        
+        Those are the names it reads without binding them, and its locals
+        read before they are certainly assigned, since an unset slot falls
+        back to the callers. assigned holds the locals bound on every path
+        so far; a loop body may not run, so its bindings are dropped after it.
+        """
+        for stmt in statements:
+            node_type = stmt.type
+            if node_type == 'FUNC_DECL':
+                continue
+            if node_type == 'IF_STMT':
+                self.collect_expression_reads(stmt.condition, assigned, free_reads)
+                then_assigned = set(assigned)
+                else_assigned = set(assigned)
+                self.collect_free_reads(stmt.then_branch, then_assigned, free_reads)
+                self.collect_free_reads(stmt.else_branch or [], else_assigned, free_reads)
+                assigned |= then_assigned & else_assigned
+            elif node_type == 'LOOP_STMT':
+                self.collect_expression_reads(stmt.condition, assigned, free_reads)
+                self.collect_free_reads(stmt.body, set(assigned), free_reads)
+            elif node_type == 'FOR_STMT':
+                self.collect_expression_reads(stmt.iterable, assigned, free_reads)
+                self.collect_free_reads(stmt.body, assigned | {stmt.name}, free_reads)
+            else:
+                for child in iter_child_nodes(stmt):
+                    self.collect_expression_reads(child, assigned, free_reads)
+                if node_type == 'VAR_DECL' or node_type == 'ASSIGN':
+                    assigned.add(stmt.name)
+    
+    def collect_expression_reads(self, node, assigned, free_reads):
+        if node.type == 'IDENTIFIER':
+            if node.value not in assigned:
+                free_reads.add(node.value)
+            return
+        for child in iter_child_nodes(node):
+            self.collect_expression_reads(child, assigned, free_reads)
+    
+    def function_declarations(self, node, declarations=None):
+        """Map every function name declared below node to its FUNC_DECL nodes"""
+        if declarations is None:
+            declarations = {}
+        if node.type == 'FUNC_DECL':
+            declarations.setdefault(node.name, []).append(node)
+        for child in iter_child_nodes(node):
+            self.function_declarations(child, declarations)
+        return declarations
+    
+    def mark_pure_functions(self, ast):
+        """Mark the functions whose result only depends on their arguments
+        
+        A pure function reads nothing but its parameters and the locals it
+        has assigned, calls no builtin with side effects, declares no
+        functions, makes no maps and only calls pure functions of the same
+        program. A name declared twice is never pure, since a call could
+        reach either body.
+        """
+        candidates = {}
+        for name, nodes in self.function_declarations(ast).items():
+            for node in nodes:
+                node.pure = False
+            if len(nodes) == 1 and not nodes[0].free_reads:
+                callees = self.user_callees(nodes[0])
+                if callees is not None:
+                    candidates[name] = (nodes[0], callees)
+        
+        changed = True
+        while changed:
+            changed = False
+            for name, (node, callees) in list(candidates.items()):
+                if not callees <= candidates.keys():
+                    del candidates[name]
+                    changed = True
+        
+        for node, _ in candidates.values():
+            node.pure = True
+    
+    def user_callees(self, func_node):
+        """Names of the user functions a function body calls, or None if it has side effects"""
+        callees = set()
+        stack = list(func_node.body)
+        while stack:
+            node = stack.pop()
+            if node.type == 'FUNC_DECL' or node.type == 'MAP':
+                return None
+            if node.type == 'CALL':
+                if not node.is_builtin:
+                    callees.add(node.callee)
+                elif self.builtin_map.get(node.callee, node.callee) not in Optimizer.PURE_BUILTINS:
+                    return None
+            stack.extend(iter_child_nodes(node))
+        return callees
+    
+    def collect_locals(self, node, slots):
+        """Give a slot to every name bound in a function body"""
+        if node.type in self.BINDING_NODES:
+            slots.setdefault(node.name, len(slots))
+        if node.type != 'FUNC_DECL':
+            for child in iter_child_nodes(node):
+                self.collect_locals(child, slots)
+    
+    def resolve_node(self, node, slots):
+        """Record the slot of every variable reference below node"""
+        node_type = node.type
+        
+        if node_type == 'FUNC_DECL':
+            self.resolve_function(node)
+            return
+        
+        if node_type == 'IDENTIFIER':
+            node.slot = slots.get(node.value) if slots is not None else None
+        elif node_type in self.BINDING_NODES:
+            node.slot = slots.get(node.name) if slots is not None else None
+        elif node_type == 'LOOP_STMT' and node.hoisted:
+            node.hoisted_slots = [slots.get(name) if slots is not None else None for name in node.hoisted]
+        
+        for child in iter_child_nodes(node):
+            self.resolve_node(child, slots)
+'''
+    
+    def _generate_closure_compiler(self):
+        """Generate the closure compiler methods of the interpreter class"""
+        return r'''
+    # Closure compiler: the AST is compiled once into pre-bound closures that
+    # take the running function's frame (None at the top level). Statements
+    # return None or a (value,) tuple for a pending return.
+    BOOLEAN_OPERATORS = frozenset([
+        'EQUALS', 'NOT_EQUALS', 'LESS', 'GREATER', 'LESS_EQUAL', 'GREATER_EQUAL', 'AND', 'OR'
+    ])
+    
+    def compile_program(self, ast):
+        """Compile a PROGRAM node into a callable"""
+        run = self.compile_block(ast.statements)
+        return lambda: run(None)
+    
+    def compile_block(self, statements):
+        """Compile a list of statements into a single closure"""
+        compiled = tuple(self.compile_statement(stmt) for stmt in statements)
+        
+        if not compiled:
+            return lambda frame: None
+        if len(compiled) == 1:
+            return compiled[0]
+        
+        def run_block(frame):
+            for stmt in compiled:
+                result = stmt(frame)
+                if result is not None:
+                    return result
+        return run_block
+    
+    def compile_statement(self, node):
+        """Compile a statement node"""
+        node_type = node.type
+        
+        if node_type == 'VAR_DECL' or node_type == 'ASSIGN':
+            name = node.name
+            slot = node.slot
+            value = self.compile_expression(node.value) if node.value is not None else lambda frame: None
+            if slot is not None:
+                def assign_local(frame):
+                    frame[slot] = value(frame)
+                return assign_local
+            variables = self.variables
+            def assign_global(frame):
+                variables[name] = value(frame)
+            return assign_global
+        
+        if node_type == 'FUNC_DECL':
+            self.compiled_bodies[id(node)] = self.compile_block(node.body)
+            define_function = self.define_function
+            def declare_function(frame):
+                define_function(node)
+            return declare_function
+        
+        if node_type == 'IF_STMT':
+            condition = self.compile_condition(node.condition)
+            then_branch = self.compile_block(node.then_branch)
+            if not node.else_branch:
+                def if_stmt(frame):
+                    if condition(frame):
+                        return then_branch(frame)
+                return if_stmt
+            else_branch = self.compile_block(node.else_branch)
+            def if_else_stmt(frame):
+                if condition(frame):
+                    return then_branch(frame)
+                return else_branch(frame)
+            return if_else_stmt
+        
+        if node_type == 'LOOP_STMT':
+            condition = self.compile_condition(node.condition)
+            body = tuple(self.compile_statement(stmt) for stmt in node.body)
+            def loop_stmt(frame):
+                while condition(frame):
+                    for stmt in body:
+                        result = stmt(frame)
+                        if result is not None:
+                            return result
+            if node.counting_step is not None:
+                loop_stmt = self.compile_counting_loop(node, loop_stmt)
+            if not node.hoisted:
+                return loop_stmt
+            clear_hoisted = self.clear_hoisted
+            def hoisting_loop_stmt(frame):
+                clear_hoisted(node, frame)
+                return loop_stmt(frame)
+            return hoisting_loop_stmt
+        
+        if node_type == 'FOR_STMT':
+            return self.compile_for(node)
+        
+        if node_type == 'RETURN_STMT':
+            if node.value is None:
+                return lambda frame: (None,)
+            value = self.compile_expression(node.value)
+            return lambda frame: (value(frame),)
+        
+        if node_type == 'EXPR_STMT':
+            expression = self.compile_expression(node.expression)
+            def expr_stmt(frame):
+                expression(frame)
+            return expr_stmt
+        
+        # Anything else runs through the tree-walker
+        def fallback(frame):
+            self.frame = frame
+            result = self.execute_node(node)
+            if isinstance(result, dict) and result.get('type') == 'RETURN':
+                return (result['value'],)
+        return fallback
+    
+    def compile_for(self, node):
+        """Compile a for loop into a native iteration over its iterable"""
+        iterable = self.compile_expression(node.iterable)
+        body = tuple(self.compile_statement(stmt) for stmt in node.body)
+        iterate = self.iterate
+        name = node.name
+        slot = node.slot
+        
+        if slot is not None:
+            def for_local(frame):
+                for value in iterate(iterable(frame)):
+                    frame[slot] = value
+                    for stmt in body:
+                        result = stmt(frame)
+                        if result is not None:
+                            return result
+            return for_local
+        
+        variables = self.variables
+        def for_global(frame):
+            for value in iterate(iterable(frame)):
+                variables[name] = value
+                for stmt in body:
+                    result = stmt(frame)
+                    if result is not None:
+                        return result
+        return for_global
+    
+    def compile_counting_loop(self, node, loop_stmt):
+        """Compile a loop the optimizer marked as counting into a range iteration
+        
+        loop_stmt, the loop compiled as usual, runs it instead when the
+        counter or the bound is not an int as the loop is entered.
+        """
+        start = self.compile_expression(node.condition.left)
+        bound = self.compile_expression(node.condition.right)
+        adjustment = COUNTING_BOUND_ADJUSTMENTS[node.condition.operator]
+        step = node.counting_step
+        body = tuple(self.compile_statement(stmt) for stmt in node.body[:-1])
+        name = node.body[-1].name
+        slot = node.body[-1].slot
+        
+        if slot is not None:
+            def counting_loop_local(frame):
+                first = start(frame)
+                last = bound(frame)
+                if type(first) is not int or type(last) is not int:
+                    return loop_stmt(frame)
+                values = range(first, last + adjustment, step)
+                for value in values:
+                    frame[slot] = value
+                    for stmt in body:
+                        result = stmt(frame)
+                        if result is not None:
+                            return result
+                if values:
+                    frame[slot] = values[-1] + step
+            return counting_loop_local
+        
+        variables = self.variables
+        def counting_loop_global(frame):
+            first = start(frame)
+            last = bound(frame)
+            if type(first) is not int or type(last) is not int:
+                return loop_stmt(frame)
+            values = range(first, last + adjustment, step)
+            for value in values:
+                variables[name] = value
+                for stmt in body:
+                    result = stmt(frame)
+                    if result is not None:
+                        return result
+            if values:
+                variables[name] = values[-1] + step
+        return counting_loop_global
+    
+    def compile_condition(self, node):
+        """Compile an expression whose value is only used for its truthiness"""
+        if node.type == 'BINARY' and node.operator in self.BOOLEAN_OPERATORS:
+            return self.compile_expression(node)
+        
+        expression = self.compile_expression(node)
+        is_truthy = self.is_truthy
+        return lambda frame: is_truthy(expression(frame))
+    
+    def compile_expression(self, node):
+        """Compile an expression node into a closure returning its value"""
+        node_type = node.type
+        
+        if node_type == 'LITERAL':
+            value = node.value
+            return lambda frame: value
+        
+        if node_type == 'IDENTIFIER':
+            return self.compile_identifier(node)
+        
+        if node_type == 'BINARY':
+            return self.compile_binary(node)
+        
+        if node_type == 'UNARY':
+            operand = self.compile_expression(node.operand)
+            if node.operator == 'MINUS':
+                return lambda frame: -operand(frame)
+            def unary(frame):
+                operand(frame)
+            return unary
+        
+        if node_type == 'CALL':
+            return self.compile_call(node)
+        
+        if node_type == 'HOISTED':
+            return self.compile_hoisted(node)
+        
+        if node_type == 'LIST':
+            elements = tuple(self.compile_expression(element) for element in node.elements)
+            return lambda frame: make_list([element(frame) for element in elements])
+        
+        if node_type == 'MAP':
+            items = tuple(self.compile_expression(item) for item in node.items)
+            build_map = self.build_map
+            return lambda frame: build_map([item(frame) for item in items])
+        
+        if node_type == 'INDEX':
+            target = self.compile_expression(node.target)
+            index = self.compile_expression(node.index)
+            index_value = self.index_value
+            return lambda frame: index_value(target(frame), index(frame))
+        
+        def fallback(frame):
+            self.frame = frame
+            return self.execute_node(node)
+        return fallback
+    
+    def compile_identifier(self, node):
+        """Compile a variable read against its resolved slot"""
+        name = node.value
+        slot = node.slot
+        lookup_dynamic = self.lookup_dynamic
+        
+        if slot is not None:
+            def load_local(frame):
+                value = frame[slot]
+                if value is not UNSET:
+                    return value
+                return lookup_dynamic(name)
+            return load_local
+        
+        if name in self.dynamic_names:
+            return lambda frame: lookup_dynamic(name)
+        
+        variables = self.variables
+        def load_global(frame):
+            try:
+                return variables[name]
+            except KeyError:
+                self.error(f"Undefined variable: {name}")
+        return load_global
+    
+    def compile_hoisted(self, node):
+        """Compile a loop-invariant expression that is computed once per loop entry"""
+        expression = self.compile_expression(node.expression)
+        name = node.name
+        slot = node.slot
+        
+        if slot is not None:
+            def load_hoisted_local(frame):
+                value = frame[slot]
+                if value is UNSET:
+                    value = frame[slot] = expression(frame)
+                return value
+            return load_hoisted_local
+        
+        variables = self.variables
+        def load_hoisted_global(frame):
+            value = variables.get(name, UNSET)
+            if value is UNSET:
+                value = variables[name] = expression(frame)
+            return value
+        return load_hoisted_global
+    
+    def compile_binary(self, node):
+        """Compile a binary operation into an operator-specific closure"""
+        operator = node.operator
+        left = self.compile_expression(node.left)
+        right = self.compile_expression(node.right)
+        
+        if operator == 'PLUS':
+            return lambda frame: left(frame) + right(frame)
+        if operator == 'MINUS':
+            return lambda frame: left(frame) - right(frame)
+        if operator == 'MULTIPLY':
+            return lambda frame: left(frame) * right(frame)
+        if operator == 'DIVIDE':
+            def divide(frame):
+                a = left(frame)
+                b = right(frame)
+                if b != 0:
+                    return a / b
+                self.error("Division by zero")
+            return divide
+        if operator == 'EQUALS':
+            return lambda frame: left(frame) == right(frame)
+        if operator == 'NOT_EQUALS':
+            return lambda frame: left(frame) != right(frame)
+        if operator == 'LESS':
+            return lambda frame: left(frame) < right(frame)
+        if operator == 'GREATER':
+            return lambda frame: left(frame) > right(frame)
+        if operator == 'LESS_EQUAL':
+            return lambda frame: left(frame) <= right(frame)
+        if operator == 'GREATER_EQUAL':
+            return lambda frame: left(frame) >= right(frame)
+        
+        # Both operands are always evaluated, like the tree-walker does
+        is_truthy = self.is_truthy
+        if operator == 'AND':
+            def logical_and(frame):
+                a = left(frame)
+                b = right(frame)
+                return is_truthy(a) and is_truthy(b)
+            return logical_and
+        if operator == 'OR':
+            def logical_or(frame):
+                a = left(frame)
+                b = right(frame)
+                return is_truthy(a) or is_truthy(b)
+            return logical_or
+        
+        def fallback(frame):
+            self.frame = frame
+            return self.execute_node(node)
+        return fallback
+    
+    def compile_call(self, node):
+        """Compile a builtin or user function call"""
+        callee = node.callee
+        arguments = tuple(self.compile_expression(arg) for arg in node.arguments)
+        
+        if node.is_builtin:
+            if self.builtin_map.get(callee, callee) == 'print':
+                output = self.output
+                def print_call(frame):
+                    output.append(' '.join([str(arg(frame)) for arg in arguments]))
+                return print_call
+            handler = self.builtin_handler(callee)
+            return lambda frame: handler([arg(frame) for arg in arguments])
+        
+        # The call site shares the inline cache of the tree-walker
+        call_target = self.call_target
+        call_function = self.call_compiled_function
+        def call(frame):
+            args = [arg(frame) for arg in arguments]
+            cache = node.cache
+            if cache is None or cache[0] != self.cache_epoch:
+                cache = call_target(node)
+            return call_function(cache[2], args)
+        return call
+    
+    def call_compiled_function(self, func_node, args):
+        """Run a compiled user function in a fresh frame, or take its result from the memo table
+        
+        Like execute_user_function, this is the only Python frame a call adds.
+        """
+        key = None
+        if self.memoize and func_node.pure:
+            key, result = self.memo_lookup(func_node, args)
+            if result is not UNSET:
+                return result
+        
+        body = self.compiled_bodies.get(id(func_node))
+        if body is None:
+            # Declared through the tree-walker, compile it on first use
+            body = self.compiled_bodies[id(func_node)] = self.compile_block(func_node.body)
+        
+        frame = [UNSET] * func_node.frame_size
+        argc = len(args)
+        for i, slot in enumerate(func_node.param_slots):
+            frame[slot] = args[i] if i < argc else None
+        
+        frames = self.frames
+        frames.append((func_node.slot_index, frame))
+        self.call_stack.append(func_node.name)
+        result = body(frame)
+        self.call_stack.pop()
+        frames.pop()
+        
+        result = result[0] if result is not None else None
+        if key is not None:
+            self.memo_table(func_node.name).store(key, result)
+        return result
+'''
+    
+    def _generate_bytecode_vm(self):
+        """Generate the bytecode compiler, virtual machine and disassembler"""
+        return r'''
+# Bytecode opcodes for the vm engine
+(OP_LOAD, OP_CONST, OP_STORE, OP_POP, OP_ADD, OP_SUB, OP_MUL, OP_DIV,
+ OP_EQ, OP_NE, OP_LT, OP_GT, OP_LE, OP_GE, OP_AND, OP_OR, OP_NEG,
+ OP_JUMP, OP_JUMP_IF_FALSE, OP_CALL, OP_BUILTIN, OP_PRINT, OP_RETURN,
+ OP_DEFINE, OP_HALT, OP_LOAD_LOCAL, OP_STORE_LOCAL, OP_LOAD_DYNAMIC,
+ OP_LOAD_CACHED, OP_JUMP_IF_SET, OP_STORE_CACHED, OP_CLEAR_CACHED, OP_TAIL_CALL,
+ OP_GET_ITER, OP_FOR_ITER, OP_UNWIND, OP_BUILD_LIST, OP_INDEX, OP_BUILD_MAP) = range(39)
+
+OPCODE_NAMES = [
+    'LOAD', 'CONST', 'STORE', 'POP', 'ADD', 'SUB', 'MUL', 'DIV',
+    'EQ', 'NE', 'LT', 'GT', 'LE', 'GE', 'AND', 'OR', 'NEG',
+    'JUMP', 'JUMP_IF_FALSE', 'CALL', 'BUILTIN', 'PRINT', 'RETURN',
+    'DEFINE', 'HALT', 'LOAD_LOCAL', 'STORE_LOCAL', 'LOAD_DYNAMIC',
+    'LOAD_CACHED', 'JUMP_IF_SET', 'STORE_CACHED', 'CLEAR_CACHED', 'TAIL_CALL',
+    'GET_ITER', 'FOR_ITER', 'UNWIND', 'BUILD_LIST', 'INDEX', 'BUILD_MAP'
+]
+
+class CodeObject:
+    """Flat bytecode for the program or for one user function"""
+    __slots__ = ('name', 'params', 'node', 'slot_index', 'slot_names', 'frame_size', 'param_slots',
+                 'ops', 'args', 'constants', 'names', 'call_sites', 'site_targets', 'functions',
+                 '_constant_index', '_name_index')
+    
+    def __init__(self, name, params, node=None):
+        self.name = name
+        self.params = params
+        self.node = node
+        self.slot_index = node.slot_index if node else {}
+        self.slot_names = list(self.slot_index)
+        self.frame_size = len(self.slot_index)
+        self.param_slots = node.param_slots if node else []
+        self.ops = array('B')
+        self.args = array('i')
+        self.constants = []
+        self.names = []
+        self.call_sites = []
+        # Inline cache of each call site: (cache epoch, function or builtin handler)
+        self.site_targets = []
+        self.functions = []
+        self._constant_index = {}
+        self._name_index = {}
+    
+    def emit(self, op, arg=0):
+        """Append an instruction and return its offset"""
+        self.ops.append(op)
+        self.args.append(arg)
+        return len(self.ops) - 1
+    
+    def patch(self, offset, target):
+        """Point the jump at offset to target"""
+        self.args[offset] = target
+    
+    def add_constant(self, value):
+        """Return the constant table index for value"""
+        key = (type(value), value)
+        if key not in self._constant_index:
+            self._constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return self._constant_index[key]
+    
+    def add_name(self, name):
+        """Return the name table index for name"""
+        if name not in self._name_index:
+            self._name_index[name] = len(self.names)
+            self.names.append(name)
+        return self._name_index[name]
+
+class BytecodeCompiler:
+    """Lowers the parsed AST into CodeObjects for the VirtualMachine"""
+    
+    BINARY_OPCODES = {
+        'PLUS': OP_ADD, 'MINUS': OP_SUB, 'MULTIPLY': OP_MUL, 'DIVIDE': OP_DIV,
+        'EQUALS': OP_EQ, 'NOT_EQUALS': OP_NE, 'LESS': OP_LT, 'GREATER': OP_GT,
+        'LESS_EQUAL': OP_LE, 'GREATER_EQUAL': OP_GE, 'AND': OP_AND, 'OR': OP_OR
+    }
+    
+    def __init__(self, builtin_map, dynamic_names=(), memoize=False):
+        self.builtin_map = builtin_map
+        self.dynamic_names = dynamic_names
+        self.memoize = memoize
+        self.frame_reads = set()
+        self.memoized = set()
+        # Iterators of the for loops around the statement being compiled,
+        # which sit on the stack while their body runs
+        self.iterators = 0
+    
+    def compile(self, ast):
+        """Compile a PROGRAM node"""
+        self.frame_reads = set()
+        self.memoized = set()
+        self.collect_functions(ast)
+        code = CodeObject('<program>', [])
+        self.compile_block(code, ast.statements)
+        code.emit(OP_HALT)
+        return code
+    
+    def compile_function(self, node):
+        """Compile a FUNC_DECL body into its own CodeObject"""
+        code = CodeObject(node.name, node.params, node)
+        enclosing_iterators, self.iterators = self.iterators, 0
+        self.compile_block(code, node.body)
+        self.iterators = enclosing_iterators
+        code.emit(OP_CONST, code.add_constant(None))
+        code.emit(OP_RETURN)
+        return code
+    
+    def compile_block(self, code, statements):
+        for stmt in statements:
+            self.compile_statement(code, stmt)
+    
+    def collect_functions(self, node):
+        """Gather the names functions read from their callers' frames, and the memoized functions"""
+        if node.type == 'FUNC_DECL':
+            self.frame_reads.update(node.free_reads)
+            if self.memoize and node.pure:
+                self.memoized.add(node.name)
+        for child in iter_child_nodes(node):
+            self.collect_functions(child)
+    
+    def is_tail_call(self, code, node):
+        """True if a returned call may replace the frame of the running function
+        
+        Callees read the locals of their callers, so the frame can only be
+        dropped when no function ever looks up one of its names there. A
+        memoized callee needs a frame of its own to store its result from,
+        and the iterators of enclosing for loops must come off the stack first.
+        """
+        return (code.node is not None and node.type == 'CALL' and not node.is_builtin and not self.iterators
+                and node.callee not in self.memoized and self.frame_reads.isdisjoint(code.slot_index))
+    
+    def compile_statement(self, code, node):
+        node_type = node.type
+        
+        if node_type == 'VAR_DECL' or node_type == 'ASSIGN':
+            if node.value is None:
+                code.emit(OP_CONST, code.add_constant(None))
+            else:
+                self.compile_expression(code, node.value)
+            if node.slot is not None:
+                code.emit(OP_STORE_LOCAL, node.slot)
+            else:
+                code.emit(OP_STORE, code.add_name(node.name))
+        
+        elif node_type == 'FUNC_DECL':
+            code.functions.append(self.compile_function(node))
+            code.emit(OP_DEFINE, len(code.functions) - 1)
+        
+        elif node_type == 'IF_STMT':
+            self.compile_expression(code, node.condition)
+            jump_else = code.emit(OP_JUMP_IF_FALSE)
+            self.compile_block(code, node.then_branch)
+            if node.else_branch:
+                jump_end = code.emit(OP_JUMP)
+                code.patch(jump_else, len(code.ops))
+                self.compile_block(code, node.else_branch)
+                code.patch(jump_end, len(code.ops))
+            else:
+                code.patch(jump_else, len(code.ops))
+        
+        elif node_type == 'LOOP_STMT':
+            for name, slot in zip(node.hoisted, node.hoisted_slots):
+                code.emit(OP_CLEAR_CACHED, self.cached_ref(code, name, slot))
+            start = len(code.ops)
+            self.compile_expression(code, node.condition)
+            jump_end = code.emit(OP_JUMP_IF_FALSE)
+            self.compile_block(code, node.body)
+            code.emit(OP_JUMP, start)
+            code.patch(jump_end, len(code.ops))
+        
+        elif node_type == 'FOR_STMT':
+            self.compile_expression(code, node.iterable)
+            code.emit(OP_GET_ITER)
+            start = code.emit(OP_FOR_ITER)
+            if node.slot is not None:
+                code.emit(OP_STORE_LOCAL, node.slot)
+            else:
+                code.emit(OP_STORE, code.add_name(node.name))
+            self.iterators += 1
+            self.compile_block(code, node.body)
+            self.iterators -= 1
+            code.emit(OP_JUMP, start)
+            code.patch(start, len(code.ops))
+        
+        elif node_type == 'RETURN_STMT':
+            if node.value is None:
+                code.emit(OP_CONST, code.add_constant(None))
+            elif self.is_tail_call(code, node.value):
+                self.compile_call(code, node.value, OP_TAIL_CALL)
+                return
+            else:
+                self.compile_expression(code, node.value)
+            if self.iterators:
+                code.emit(OP_UNWIND, self.iterators)
+            code.emit(OP_RETURN)
+        
+        elif node_type == 'EXPR_STMT':
+            self.compile_expression(code, node.expression)
+            code.emit(OP_POP)
+        
+        else:
+            raise NotImplementedError(f"vm engine cannot compile {node_type}")
+    
+    def compile_expression(self, code, node):
+        node_type = node.type
+        
+        if node_type == 'LITERAL':
+            code.emit(OP_CONST, code.add_constant(node.value))
+        
+        elif node_type == 'IDENTIFIER':
+            if node.slot is not None:
+                code.emit(OP_LOAD_LOCAL, node.slot)
+            elif code.node is not None and node.value in self.dynamic_names:
+                code.emit(OP_LOAD_DYNAMIC, code.add_name(node.value))
+            else:
+                code.emit(OP_LOAD, code.add_name(node.value))
+        
+        elif node_type == 'BINARY':
+            self.compile_expression(code, node.left)
+            self.compile_expression(code, node.right)
+            code.emit(self.BINARY_OPCODES[node.operator])
+        
+        elif node_type == 'UNARY':
+            self.compile_expression(code, node.operand)
+            if node.operator == 'MINUS':
+                code.emit(OP_NEG)
+            else:
+                code.emit(OP_POP)
+                code.emit(OP_CONST, code.add_constant(None))
+        
+        elif node_type == 'HOISTED':
+            ref = self.cached_ref(code, node.name, node.slot)
+            code.emit(OP_LOAD_CACHED, ref)
+            jump_end = code.emit(OP_JUMP_IF_SET)
+            self.compile_expression(code, node.expression)
+            code.emit(OP_STORE_CACHED, ref)
+            code.patch(jump_end, len(code.ops))
+        
+        elif node_type == 'LIST':
+            for element in node.elements:
+                self.compile_expression(code, element)
+            code.emit(OP_BUILD_LIST, len(node.elements))
+        
+        elif node_type == 'MAP':
+            for item in node.items:
+                self.compile_expression(code, item)
+            code.emit(OP_BUILD_MAP, len(node.items))
+        
+        elif node_type == 'INDEX':
+            self.compile_expression(code, node.target)
+            self.compile_expression(code, node.index)
+            code.emit(OP_INDEX)
+        
+        elif node_type == 'CALL':
+            if not node.is_builtin:
+                self.compile_call(code, node, OP_CALL)
+            elif self.builtin_map.get(node.callee, node.callee) == 'print':
+                for arg in node.arguments:
+                    self.compile_expression(code, arg)
+                code.emit(OP_PRINT, len(node.arguments))
+            else:
+                self.compile_call(code, node, OP_BUILTIN)
+        
+        else:
+            raise NotImplementedError(f"vm engine cannot compile {node_type}")
+    
+    def compile_call(self, code, node, op):
+        """Push the arguments of a CALL and emit op on its call site"""
+        for arg in node.arguments:
+            self.compile_expression(code, arg)
+        code.call_sites.append((node.callee, len(node.arguments)))
+        code.site_targets.append(None)
+        code.emit(op, len(code.call_sites) - 1)
+    
+    def cached_ref(self, code, name, slot):
+        """Operand of the *_CACHED opcodes: a frame slot, or -1 - the index of a global name"""
+        return slot if slot is not None else -1 - code.add_name(name)
+
+class VirtualMachine:
+    """Runs CodeObjects in a single dispatch loop with explicit call frames
+    
+    User function calls never recurse in Python, so the depth of a program
+    is only bounded by MAX_CALL_DEPTH. A TAIL_CALL reuses the frame of the
+    running function, so tail-recursive functions run in constant space.
+    """
+    
+    MAX_CALL_DEPTH = 100000
+    
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.functions = {}
+    
+    def run(self, code):
+        """Execute a program CodeObject to completion"""
+        interp = self.interpreter
+        is_truthy = interp.is_truthy
+        output = interp.output
+        functions = self.functions
+        variables = interp.variables
+        memoize = interp.memoize
+        call_stack = interp.call_stack
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        frames = []
+        slots = None
+        
+        ops, args, constants, names = code.ops, code.args, code.constants, code.names
+        sites, targets = code.call_sites, code.site_targets
+        pc = 0
+        
+        while True:
+            op = ops[pc]
+            arg = args[pc]
+            pc += 1
+            
+            if op == OP_LOAD_LOCAL:
+                value = slots[arg]
+                if value is UNSET:
+                    value = self.load_dynamic(code.slot_names[arg], code, slots, frames)
+                push(value)
+            elif op == OP_CONST:
+                push(constants[arg])
+            elif op == OP_STORE_LOCAL:
+                slots[arg] = pop()
+            elif op == OP_LOAD:
+                try:
+                    push(variables[names[arg]])
+                except KeyError:
+                    interp.error(f"Undefined variable: {names[arg]}")
+            elif op == OP_STORE:
+                variables[names[arg]] = pop()
+            elif op == OP_JUMP_IF_FALSE:
+                value = pop()
+                if value is False or (value is not True and not is_truthy(value)):
+                    pc = arg
+            elif op == OP_JUMP:
+                pc = arg
+            elif op == OP_ADD:
+                right = pop()
+                stack[-1] = stack[-1] + right
+            elif op == OP_SUB:
+                right = pop()
+                stack[-1] = stack[-1] - right
+            elif op == OP_MUL:
+                right = pop()
+                stack[-1] = stack[-1] * right
+            elif op == OP_DIV:
+                right = pop()
+                if right == 0:
+                    interp.error("Division by zero")
+                stack[-1] = stack[-1] / right
+            elif op == OP_LT:
+                right = pop()
+                stack[-1] = stack[-1] < right
+            elif op == OP_GT:
+                right = pop()
+                stack[-1] = stack[-1] > right
+            elif op == OP_LE:
+                right = pop()
+                stack[-1] = stack[-1] <= right
+            elif op == OP_GE:
+                right = pop()
+                stack[-1] = stack[-1] >= right
+            elif op == OP_EQ:
+                right = pop()
+                stack[-1] = stack[-1] == right
+            elif op == OP_NE:
+                right = pop()
+                stack[-1] = stack[-1] != right
+            elif op == OP_POP:
+                pop()
+            elif op == OP_CALL or op == OP_TAIL_CALL:
+                callee, argc = sites[arg]
+                target = targets[arg]
+                if target is None or target[0] != interp.cache_epoch:
+                    function = functions.get(callee)
+                    if function is None:
+                        interp.error(f"Undefined function: {callee}")
+                    target = targets[arg] = (interp.cache_epoch, function)
+                function = target[1]
+                call_args = stack[len(stack) - argc:]
+                del stack[len(stack) - argc:]
+                
+                if op == OP_CALL:
+                    if len(frames) >= self.MAX_CALL_DEPTH:
+                        interp.error("Maximum call depth exceeded")
+                    memo = None
+                    if memoize and function.node.pure:
+                        table = interp.memo_table(callee)
+                        key = MemoTable.key(call_args, len(function.params))
+                        value = table.lookup(key) if key is not None else UNSET
+                        if value is not UNSET:
+                            push(value)
+                            continue
+                        if key is not None:
+                            memo = (table, key)
+                    frames.append((code, pc, slots, memo))
+                    call_stack.append(callee)
+                else:
+                    call_stack[-1] = callee
+                slots = [UNSET] * function.frame_size
+                for i, slot in enumerate(function.param_slots):
+                    slots[slot] = call_args[i] if i < argc else None
+                
+                code = function
+                ops, args, constants, names = code.ops, code.args, code.constants, code.names
+                sites, targets = code.call_sites, code.site_targets
+                pc = 0
+            elif op == OP_RETURN:
+                if not frames:
+                    break
+                # The return value stays on top of the stack for the caller
+                code, pc, slots, memo = frames.pop()
+                call_stack.pop()
+                if memo is not None:
+                    memo[0].store(memo[1], stack[-1])
+                ops, args, constants, names = code.ops, code.args, code.constants, code.names
+                sites, targets = code.call_sites, code.site_targets
+            elif op == OP_PRINT:
+                values = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                output.append(' '.join([str(value) for value in values]))
+                push(None)
+            elif op == OP_BUILTIN:
+                callee, argc = sites[arg]
+                call_args = stack[len(stack) - argc:]
+                del stack[len(stack) - argc:]
+                target = targets[arg]
+                if target is None or target[0] != interp.cache_epoch:
+                    target = targets[arg] = (interp.cache_epoch, interp.builtin_handler(callee))
+                push(target[1](call_args))
+            elif op == OP_AND:
+                right = pop()
+                stack[-1] = is_truthy(stack[-1]) and is_truthy(right)
+            elif op == OP_OR:
+                right = pop()
+                stack[-1] = is_truthy(stack[-1]) or is_truthy(right)
+            elif op == OP_NEG:
+                stack[-1] = -stack[-1]
+            elif op == OP_LOAD_DYNAMIC:
+                push(self.load_dynamic(names[arg], code, slots, frames))
+            elif op == OP_LOAD_CACHED:
+                push(slots[arg] if arg >= 0 else variables.get(names[-1 - arg], UNSET))
+            elif op == OP_JUMP_IF_SET:
+                if stack[-1] is not UNSET:
+                    pc = arg
+                else:
+                    pop()
+            elif op == OP_STORE_CACHED:
+                if arg >= 0:
+                    slots[arg] = stack[-1]
+                else:
+                    variables[names[-1 - arg]] = stack[-1]
+            elif op == OP_CLEAR_CACHED:
+                if arg >= 0:
+                    slots[arg] = UNSET
+                else:
+                    variables.pop(names[-1 - arg], None)
+            elif op == OP_DEFINE:
+                function = code.functions[arg]
+                functions[function.name] = function
+                interp.define_function(function.node)
+            elif op == OP_BUILD_LIST:
+                items = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                push(make_list(items))
+            elif op == OP_BUILD_MAP:
+                items = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                push(interp.build_map(items))
+            elif op == OP_INDEX:
+                index = pop()
+                stack[-1] = interp.index_value(stack[-1], index)
+            elif op == OP_GET_ITER:
+                stack[-1] = iter(interp.iterate(stack[-1]))
+            elif op == OP_FOR_ITER:
+                value = next(stack[-1], UNSET)
+                if value is UNSET:
+                    pop()
+                    pc = arg
+                else:
+                    push(value)
+            elif op == OP_UNWIND:
+                # Drop the iterators of the for loops a return leaves
+                del stack[-1 - arg:-1]
+            elif op == OP_HALT:
+                break
+            else:
+                raise Exception(f"Unknown opcode: {op}")
+    
+    def load_dynamic(self, name, code, slots, frames):
+        """Read a name from the running and calling frames, then from the globals"""
+        interp = self.interpreter
+        if name in interp.dynamic_names:
+            slot = code.slot_index.get(name)
+            if slot is not None and slots[slot] is not UNSET:
+                return slots[slot]
+            for caller, _, caller_slots, _ in reversed(frames):
+                slot = caller.slot_index.get(name)
+                if slot is not None and caller_slots[slot] is not UNSET:
+                    return caller_slots[slot]
+        
+        if name in interp.variables:
+            return interp.variables[name]
+        interp.error(f"Undefined variable: {name}")
+
+def disassemble(code):
+    """Return a readable listing of a CodeObject and the functions it declares"""
+    lines = [f"== {code.name}({', '.join(code.params)}) =="]
+    
+    for offset, (op, arg) in enumerate(zip(code.ops, code.args)):
+        if op == OP_CONST:
+            detail = repr(code.constants[arg])
+        elif op == OP_LOAD or op == OP_STORE or op == OP_LOAD_DYNAMIC:
+            detail = code.names[arg]
+        elif op == OP_LOAD_LOCAL or op == OP_STORE_LOCAL:
+            detail = code.slot_names[arg]
+        elif op == OP_CALL or op == OP_TAIL_CALL or op == OP_BUILTIN:
+            callee, argc = code.call_sites[arg]
+            detail = f"{callee}/{argc}"
+        elif op == OP_DEFINE:
+            detail = code.functions[arg].name
+        elif op == OP_JUMP or op == OP_JUMP_IF_FALSE or op == OP_JUMP_IF_SET or op == OP_FOR_ITER:
+            detail = f"-> {arg}"
+        elif op in (OP_LOAD_CACHED, OP_STORE_CACHED, OP_CLEAR_CACHED):
+            detail = code.slot_names[arg] if arg >= 0 else code.names[-1 - arg]
+        else:
+            detail = ''
+        lines.append(f"{offset:>5}  {OPCODE_NAMES[op]:<14}{arg:>5}  {detail}".rstrip())
+    
+    for function in code.functions:
+        lines.append('')
+        lines.append(disassemble(function))
+    
+    return '\n'.join(lines)
+'''
+    
+    def _generate_ast_cache(self):
+        """Generate the on-disk cache of parsed programs"""
+        return r'''
+class AstCache:
+    """Stores parsed programs in a __slangcache__ directory next to the source file
+    
+    Entries hold the already resolved AST and the dynamic names the resolver
+    found, as JSON in the format of node_to_dict, under a header line with
+    the cache key, so a hit skips the lexer, the parser and the resolver.
+    The key covers the source bytes, the language definition and the
+    interpreter itself; editing any of them or regenerating the interpreter
+    makes old entries miss. Loading an entry only builds node classes from
+    plain data, so a cache that came with untrusted sources cannot run code.
+    """
+    
+    VERSION = 2
+    DIRECTORY = '__slangcache__'
+    interpreter_hash = None
+    
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.hash_interpreter()
+    
+    @classmethod
+    def hash_interpreter(cls):
+        """Hash of this interpreter's own source, computed once per process"""
+        if cls.interpreter_hash is None:
+            with open(os.path.abspath(__file__), 'rb') as f:
+                cls.interpreter_hash = hashlib.sha256(f.read()).hexdigest()
+        return cls.interpreter_hash
+    
+    def cache_key(self, source):
+        """Hash of the source bytes, the language definition, the interpreter version and the optimizer passes"""
+        digest = hashlib.sha256()
+        digest.update(f"{self.VERSION}:{sys.implementation.cache_tag}:{self.interpreter_hash}:"
+                      f"{self.interpreter.optimizer_key()}:".encode('utf-8'))
+        digest.update(self.interpreter.language_hash.encode('utf-8'))
+        digest.update(source.encode('utf-8') if isinstance(source, str) else source)
+        return digest.hexdigest()
+    
+    def cache_file(self, filename):
+        directory, name = os.path.split(os.path.abspath(filename))
+        return os.path.join(directory, self.DIRECTORY, name + '.ast')
+    
+    def load(self, source, filename):
+        """Return the cached AST of source, or None if there is no current one"""
+        try:
+            with open(self.cache_file(filename), 'rb') as f:
+                if f.readline().rstrip(b'\n') != self.cache_key(source).encode('ascii'):
+                    return None
+                entry = json.load(f)
+            dynamic_names = entry['dynamic_names']
+            ast = node_from_dict(entry['ast'])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError, RecursionError):
+            # Also covers entries that are damaged or were not written by
+            # this cache; they are simply written again
+            return None
+        self.interpreter.dynamic_names.update(dynamic_names)
+        return ast
+    
+    def store(self, source, filename, ast):
+        """Write the AST of source to the cache, ignoring unwritable directories"""
+        cache_file = self.cache_file(filename)
+        temp_file = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            with open(temp_file, 'wb') as f:
+                f.write(self.cache_key(source).encode('ascii') + b'\n')
+                entry = {'dynamic_names': sorted(self.interpreter.dynamic_names), 'ast': node_to_dict(ast)}
+                f.write(json.dumps(entry).encode('utf-8'))
+            os.replace(temp_file, cache_file)
+        except (OSError, ValueError, TypeError, RecursionError):
+            pass
+'''
+    
+    def _generate_optimizer(self):
+        """Generate the AST optimizer run between parsing and resolving"""
+        return r'''
+class BasicBlock:
+    """A run of elements that execute one after another, and the blocks that may follow"""
+    
+    __slots__ = ('elements', 'successors')
+    
+    def __init__(self):
+        self.elements = []
+        self.successors = []
+
+
+class ControlFlowGraph:
+    """Control flow graph of a function body or of the top-level code
+    
+    The elements of the blocks are the simple statements of the unit and
+    the condition expressions of its IF_STMT and LOOP_STMT nodes, in the
+    order they run. A FOR_STMT contributes its iterable, and itself as the
+    first element of its body, where it stores the loop variable. A
+    RETURN_STMT jumps to exit. A FUNC_DECL is an element
+    of the unit declaring it; its body is a unit of its own. Statements
+    that cannot be reached are left out.
+    """
+    
+    def __init__(self, statements):
+        self.blocks = []
+        self.entry = self.new_block()
+        self.exit = BasicBlock()
+        end = self.build(statements, self.entry)
+        if end is not None:
+            end.successors.append(self.exit)
+        self.blocks.append(self.exit)
+    
+    def new_block(self):
+        block = BasicBlock()
+        self.blocks.append(block)
+        return block
+    
+    def build(self, statements, block):
+        """Add statements from the end of block on, returning the block they fall out of"""
+        for stmt in statements:
+            if block is None:
+                break
+            node_type = stmt.type
+            
+            if node_type == 'IF_STMT':
+                block.elements.append(stmt.condition)
+                ends = []
+                for branch in (stmt.then_branch, stmt.else_branch or []):
+                    start = self.new_block()
+                    block.successors.append(start)
+                    ends.append(self.build(branch, start))
+                block = None
+                if ends != [None, None]:
+                    block = self.new_block()
+                    for end in ends:
+                        if end is not None:
+                            end.successors.append(block)
+            
+            elif node_type == 'LOOP_STMT':
+                header = self.new_block()
+                block.successors.append(header)
+                header.elements.append(stmt.condition)
+                body = self.new_block()
+                header.successors.append(body)
+                end = self.build(stmt.body, body)
+                if end is not None:
+                    end.successors.append(header)
+                block = self.new_block()
+                header.successors.append(block)
+            
+            elif node_type == 'FOR_STMT':
+                block.elements.append(stmt.iterable)
+                header = self.new_block()
+                block.successors.append(header)
+                body = self.new_block()
+                header.successors.append(body)
+                body.elements.append(stmt)
+                end = self.build(stmt.body, body)
+                if end is not None:
+                    end.successors.append(header)
+                block = self.new_block()
+                header.successors.append(block)
+            
+            elif node_type == 'RETURN_STMT':
+                block.elements.append(stmt)
+                block.successors.append(self.exit)
+                block = None
+            
+            else:
+                block.elements.append(stmt)
+        
+        return block
+    
+    def live_out(self, uses_defs, live_at_exit):
+        """Solve backward liveness, returning the names live after each block
+        
+        uses_defs(element) gives the names an element reads and the name it
+        stores, if any.
+        """
+        summaries = {}
+        for block in self.blocks:
+            uses = set()
+            defs = set()
+            for element in reversed(block.elements):
+                used, stored = uses_defs(element)
+                if stored is not None:
+                    uses.discard(stored)
+                    defs.add(stored)
+                uses |= used
+            summaries[block] = (uses, defs)
+        
+        live_in = {block: set() for block in self.blocks}
+        live_in[self.exit] = set(live_at_exit)
+        live_out = {block: set() for block in self.blocks}
+        changed = True
+        while changed:
+            changed = False
+            for block in reversed(self.blocks):
+                out = set(live_at_exit) if block is self.exit else set()
+                for successor in block.successors:
+                    out |= live_in[successor]
+                uses, defs = summaries[block]
+                new_in = uses | (out - defs)
+                if new_in != live_in[block] or out != live_out[block]:
+                    live_in[block] = new_in
+                    live_out[block] = out
+                    changed = True
+        return live_out
+
+
+class Optimizer:
+    """Rewrites a parsed program before it is resolved and run
+    
+    The fold pass turns BINARY and UNARY nodes whose operands are literals
+    into a literal, replaces IF_STMT and LOOP_STMT nodes with a constant
+    condition by the statements that would run, and drops statements after
+    a RETURN_STMT in the same block. Blocks do not open scopes, so a branch
+    can be spliced into the enclosing block as it is. An operation that
+    would fail at runtime is left alone so the error still happens when,
+    and only if, it runs.
+    
+    The other passes work on the ControlFlowGraph of every function body
+    and of the top-level code. dead_stores removes assignments that no
+    later statement reads, unused_functions removes FUNC_DECL nodes no
+    call can reach, and hoist computes loop-invariant expressions once per
+    entry into their loop. counting_loops marks the loops that step an int
+    counter towards an invariant bound, which the tree-walker and the
+    closure compiler run over a range. stats counts each kind of rewrite.
+    """
+    
+    PASSES = ('fold', 'dead_stores', 'unused_functions', 'hoist', 'counting_loops')
+    
+    # Comparisons a counting loop may test, and the sign of the step they need
+    COUNTING_COMPARISONS = {'LESS': 1, 'LESS_EQUAL': 1, 'GREATER': -1, 'GREATER_EQUAL': -1}
+    
+    # Builtins without side effects whose result only depends on their arguments
+    PURE_BUILTINS = frozenset(['length', 'string', 'number', 'range', 'sum', 'min', 'max', 'sort', 'map_add', 'dot'])
+    
+    FOLDERS = {
+        'PLUS': lambda a, b: a + b,
+        'MINUS': lambda a, b: a - b,
+        'MULTIPLY': lambda a, b: a * b,
+        'DIVIDE': lambda a, b: a / b,
+        'EQUALS': lambda a, b: a == b,
+        'NOT_EQUALS': lambda a, b: a != b,
+        'LESS': lambda a, b: a < b,
+        'GREATER': lambda a, b: a > b,
+        'LESS_EQUAL': lambda a, b: a <= b,
+        'GREATER_EQUAL': lambda a, b: a >= b,
+    }
+    
+    # Larger folded strings and numbers would only bloat the AST and its caches
+    MAX_FOLDED_SIZE = 4096
+    
+    def __init__(self, is_truthy, builtin_map, passes=PASSES):
+        self.is_truthy = is_truthy
+        self.builtin_map = builtin_map
+        self.passes = frozenset(passes)
+        self.stats = {'folded': 0, 'branches': 0, 'dead_loops': 0, 'unreachable': 0,
+                      'dead_stores': 0, 'unused_functions': 0, 'hoisted': 0, 'counting_loops': 0}
+        self.hoisted_count = 0
+    
+    def optimize(self, program, whole_program=True):
+        """Optimize a PROGRAM node in place and return it
+        
+        Functions are only removed from a whole program, since a statement
+        run on its own may declare functions that later statements call.
+        """
+        if 'fold' in self.passes:
+            program.statements = self.block(program.statements)
+        if 'unused_functions' in self.passes and whole_program:
+            program.statements = self.remove_unused_functions(program.statements)
+        if 'dead_stores' in self.passes:
+            program.statements = self.remove_dead_stores(program.statements, False)
+        if 'hoist' in self.passes:
+            self.hoisted_count = 0
+            self.hoist_loops(program.statements)
+        if 'counting_loops' in self.passes:
+            self.mark_counting_loops(program.statements)
+        return program
+    
+    def block(self, statements):
+        """Optimize a list of statements, cutting it after the first return"""
+        result = []
+        for index, stmt in enumerate(statements):
+            result.extend(self.statement(stmt))
+            if result and result[-1].type == 'RETURN_STMT':
+                self.stats['unreachable'] += len(statements) - index - 1
+                break
+        return result
+    
+    def statement(self, node):
+        """Optimize a statement, returning the statements that replace it"""
+        node_type = node.type
+        
+        if node_type == 'VAR_DECL' or node_type == 'ASSIGN' or node_type == 'RETURN_STMT':
+            if node.value is not None:
+                node.value = self.expression(node.value)
+        elif node_type == 'EXPR_STMT':
+            node.expression = self.expression(node.expression)
+        elif node_type == 'FUNC_DECL':
+            node.body = self.block(node.body)
+        elif node_type == 'IF_STMT':
+            node.condition = self.expression(node.condition)
+            if node.condition.type == 'LITERAL':
+                self.stats['branches'] += 1
+                branch = node.then_branch if self.is_truthy(node.condition.value) else node.else_branch
+                return self.block(branch or [])
+            node.then_branch = self.block(node.then_branch)
+            if node.else_branch:
+                node.else_branch = self.block(node.else_branch)
+        elif node_type == 'LOOP_STMT':
+            node.condition = self.expression(node.condition)
+            if node.condition.type == 'LITERAL' and not self.is_truthy(node.condition.value):
+                self.stats['dead_loops'] += 1
+                return []
+            node.body = self.block(node.body)
+        elif node_type == 'FOR_STMT':
+            node.iterable = self.expression(node.iterable)
+            node.body = self.block(node.body)
+        
+        return [node]
+    
+    def expression(self, node):
+        """Optimize an expression, returning the node that replaces it"""
+        node_type = node.type
+        
+        if node_type == 'BINARY':
+            node.left = self.expression(node.left)
+            node.right = self.expression(node.right)
+            if node.left.type == 'LITERAL' and node.right.type == 'LITERAL':
+                left = node.left.value
+                right = node.right.value
+                if node.operator == 'AND':
+                    return self.fold(node, lambda: self.is_truthy(left) and self.is_truthy(right))
+                if node.operator == 'OR':
+                    return self.fold(node, lambda: self.is_truthy(left) or self.is_truthy(right))
+                return self.fold(node, lambda: self.FOLDERS[node.operator](left, right))
+        
+        elif node_type == 'UNARY':
+            node.operand = self.expression(node.operand)
+            if node.operand.type == 'LITERAL' and node.operator == 'MINUS':
+                operand = node.operand.value
+                return self.fold(node, lambda: -operand)
+        
+        elif node_type == 'CALL':
+            node.arguments = [self.expression(arg) for arg in node.arguments]
+        
+        elif node_type == 'LIST':
+            node.elements = [self.expression(element) for element in node.elements]
+        
+        elif node_type == 'MAP':
+            node.items = [self.expression(item) for item in node.items]
+        
+        elif node_type == 'INDEX':
+            node.target = self.expression(node.target)
+            node.index = self.expression(node.index)
+        
+        return node
+    
+    def fold(self, node, evaluate):
+        """Replace node by a literal of its value, unless computing it fails"""
+        try:
+            value = evaluate()
+        except Exception:
+            return node
+        
+        if isinstance(value, float) and not math.isfinite(value):
+            return node
+        if isinstance(value, str) and len(value) > self.MAX_FOLDED_SIZE:
+            return node
+        if isinstance(value, int) and value.bit_length() > self.MAX_FOLDED_SIZE:
+            return node
+        
+        self.stats['folded'] += 1
+        return Literal(value)
+    
+    def is_pure_call(self, node):
+        return node.is_builtin and self.builtin_map.get(node.callee, node.callee) in self.PURE_BUILTINS
+    
+    def reads(self, node, names):
+        """Add the variables an expression reads to names; True if it calls a user function"""
+        node_type = node.type
+        if node_type == 'IDENTIFIER':
+            names.add(node.value)
+            return False
+        calls = node_type == 'CALL' and not node.is_builtin
+        for child in iter_child_nodes(node):
+            if self.reads(child, names):
+                calls = True
+        return calls
+    
+    def stored_names(self, statements, names):
+        """Add the names assigned by statements, outside nested function bodies, to names"""
+        for stmt in statements:
+            for node in self.walk(stmt):
+                if node.type == 'VAR_DECL' or node.type == 'ASSIGN' or node.type == 'FOR_STMT':
+                    names.add(node.name)
+        return names
+    
+    def walk(self, node):
+        """Yield node and the nodes below it, without entering function bodies"""
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            yield node
+            if node.type != 'FUNC_DECL':
+                stack.extend(iter_child_nodes(node))
+    
+    def remove_dead_stores(self, statements, in_function):
+        """Remove the VAR_DECL and ASSIGN statements of a unit whose value is never read
+        
+        A function reads the locals of its callers, so a call to a user
+        function reads every name the unit assigns. Locals die when their
+        function returns; globals stay alive after the top-level code.
+        """
+        universe = self.stored_names(statements, set())
+        
+        def uses_defs(element):
+            names = set()
+            node_type = element.type
+            if node_type == 'VAR_DECL' or node_type == 'ASSIGN':
+                if element.value is not None and self.reads(element.value, names):
+                    names = set(universe)
+                return names, element.name
+            if node_type == 'FOR_STMT':
+                return names, element.name
+            if node_type != 'FUNC_DECL' and self.reads(element, names):
+                names = set(universe)
+            return names, None
+        
+        graph = ControlFlowGraph(statements)
+        live_out = graph.live_out(uses_defs, () if in_function else universe)
+        dead = set()
+        for block in graph.blocks:
+            live = set(live_out[block])
+            for element in reversed(block.elements):
+                used, stored = uses_defs(element)
+                if stored is not None:
+                    if stored not in live and element.type != 'FOR_STMT':
+                        dead.add(id(element))
+                    live.discard(stored)
+                live |= used
+        
+        return self.rewrite_dead_stores(statements, dead)
+    
+    def rewrite_dead_stores(self, statements, dead):
+        result = []
+        for stmt in statements:
+            node_type = stmt.type
+            if id(stmt) in dead:
+                self.stats['dead_stores'] += 1
+                value = stmt.value
+                # Evaluating the value may still fail or call a function
+                if value is not None and value.type != 'LITERAL':
+                    result.append(ExprStmt(value))
+                continue
+            if node_type == 'FUNC_DECL':
+                stmt.body = self.remove_dead_stores(stmt.body, True)
+            elif node_type == 'IF_STMT':
+                stmt.then_branch = self.rewrite_dead_stores(stmt.then_branch, dead)
+                if stmt.else_branch:
+                    stmt.else_branch = self.rewrite_dead_stores(stmt.else_branch, dead)
+            elif node_type == 'LOOP_STMT' or node_type == 'FOR_STMT':
+                stmt.body = self.rewrite_dead_stores(stmt.body, dead)
+            result.append(stmt)
+        return result
+    
+    def remove_unused_functions(self, statements):
+        """Remove the FUNC_DECL nodes whose name no reachable call uses"""
+        declarations = {}
+        pending = []
+        for stmt in statements:
+            self.collect_calls(stmt, pending, declarations)
+        
+        reachable = set()
+        while pending:
+            name = pending.pop()
+            if name in reachable:
+                continue
+            reachable.add(name)
+            for declaration in declarations.get(name, ()):
+                for stmt in declaration.body:
+                    self.collect_calls(stmt, pending, {})
+        
+        return self.drop_functions(statements, reachable)
+    
+    def collect_calls(self, node, calls, declarations):
+        """Add the user functions called below node to calls and index its declarations"""
+        for child in self.walk(node):
+            if child.type == 'CALL' and not child.is_builtin:
+                calls.append(child.callee)
+            elif child.type == 'FUNC_DECL':
+                declarations.setdefault(child.name, []).append(child)
+                for stmt in child.body:
+                    self.collect_declarations(stmt, declarations)
+    
+    def collect_declarations(self, node, declarations):
+        for child in self.walk(node):
+            if child.type == 'FUNC_DECL':
+                declarations.setdefault(child.name, []).append(child)
+                for stmt in child.body:
+                    self.collect_declarations(stmt, declarations)
+    
+    def drop_functions(self, statements, reachable):
+        result = []
+        for stmt in statements:
+            node_type = stmt.type
+            if node_type == 'FUNC_DECL':
+                if stmt.name not in reachable:
+                    self.stats['unused_functions'] += 1
+                    continue
+                stmt.body = self.drop_functions(stmt.body, reachable)
+            elif node_type == 'IF_STMT':
+                stmt.then_branch = self.drop_functions(stmt.then_branch, reachable)
+                if stmt.else_branch:
+                    stmt.else_branch = self.drop_functions(stmt.else_branch, reachable)
+            elif node_type == 'LOOP_STMT' or node_type == 'FOR_STMT':
+                stmt.body = self.drop_functions(stmt.body, reachable)
+            result.append(stmt)
+        return result
+    
+    def hoist_loops(self, statements):
+        """Hoist the invariant expressions of every loop, outer loops first"""
+        for stmt in statements:
+            node_type = stmt.type
+            if node_type == 'FUNC_DECL':
+                self.hoist_loops(stmt.body)
+            elif node_type == 'IF_STMT':
+                self.hoist_loops(stmt.then_branch)
+                self.hoist_loops(stmt.else_branch or [])
+            elif node_type == 'LOOP_STMT':
+                self.hoist_loop(stmt)
+                self.hoist_loops(stmt.body)
+            elif node_type == 'FOR_STMT':
+                self.hoist_loops(stmt.body)
+    
+    def hoist_loop(self, loop):
+        """Replace the loop-invariant expressions of a loop by HOISTED nodes
+        
+        A function cannot assign the variables of its callers or the
+        globals, so only the assignments in the loop itself can change a
+        name it reads. A map can change without an assignment, though, so a
+        loop that may set a key hoists no builtin call or index at all. The
+        HOISTED node still computes its expression at its own position, so
+        errors and the order of evaluation are kept.
+        """
+        assigned = self.stored_names([loop], set())
+        maps_fixed = not self.changes_maps(loop)
+        hoisted = []
+        
+        def replace(node):
+            if self.is_invariant(node, assigned, maps_fixed):
+                if node.type == 'LITERAL' or node.type == 'IDENTIFIER' or node.type == 'HOISTED':
+                    return node
+                name = f"$h{self.hoisted_count}"
+                self.hoisted_count += 1
+                hoisted.append(name)
+                self.stats['hoisted'] += 1
+                return Hoisted(name, node)
+            if node.type == 'BINARY':
+                node.left = replace(node.left)
+                node.right = replace(node.right)
+            elif node.type == 'UNARY':
+                node.operand = replace(node.operand)
+            elif node.type == 'CALL':
+                node.arguments = [replace(arg) for arg in node.arguments]
+            elif node.type == 'LIST':
+                node.elements = [replace(element) for element in node.elements]
+            elif node.type == 'MAP':
+                node.items = [replace(item) for item in node.items]
+            elif node.type == 'INDEX':
+                node.target = replace(node.target)
+                node.index = replace(node.index)
+            return node
+        
+        def replace_block(statements):
+            for stmt in statements:
+                node_type = stmt.type
+                if node_type == 'VAR_DECL' or node_type == 'ASSIGN' or node_type == 'RETURN_STMT':
+                    if stmt.value is not None:
+                        stmt.value = replace(stmt.value)
+                elif node_type == 'EXPR_STMT':
+                    stmt.expression = replace(stmt.expression)
+                elif node_type == 'IF_STMT':
+                    stmt.condition = replace(stmt.condition)
+                    replace_block(stmt.then_branch)
+                    replace_block(stmt.else_branch or [])
+                elif node_type == 'LOOP_STMT':
+                    stmt.condition = replace(stmt.condition)
+                    replace_block(stmt.body)
+                elif node_type == 'FOR_STMT':
+                    stmt.iterable = replace(stmt.iterable)
+                    replace_block(stmt.body)
+        
+        loop.condition = replace(loop.condition)
+        replace_block(loop.body)
+        loop.hoisted = tuple(hoisted)
+    
+    def mark_counting_loops(self, statements):
+        """Set the counting_step of every loop that counts"""
+        for stmt in statements:
+            node_type = stmt.type
+            if node_type == 'FUNC_DECL':
+                self.mark_counting_loops(stmt.body)
+            elif node_type == 'IF_STMT':
+                self.mark_counting_loops(stmt.then_branch)
+                self.mark_counting_loops(stmt.else_branch or [])
+            elif node_type == 'LOOP_STMT':
+                stmt.counting_step = self.counting_step(stmt)
+                if stmt.counting_step is not None:
+                    self.stats['counting_loops'] += 1
+                self.mark_counting_loops(stmt.body)
+            elif node_type == 'FOR_STMT':
+                self.mark_counting_loops(stmt.body)
+    
+    def counting_step(self, loop):
+        """The step of a loop like `i < n { ... i = i + 1 }`, or None
+        
+        The condition compares a variable with a loop-invariant bound, the
+        body ends with an assignment that adds a nonzero int literal to the
+        variable and no other statement of the loop assigns it. The step
+        must move the variable towards the bound.
+        """
+        condition = loop.condition
+        if (condition.type != 'BINARY' or condition.operator not in self.COUNTING_COMPARISONS
+                or condition.left.type != 'IDENTIFIER' or not loop.body):
+            return None
+        name = condition.left.value
+        
+        increment = loop.body[-1]
+        if increment.type != 'ASSIGN' or increment.name != name or increment.value.type != 'BINARY':
+            return None
+        value = increment.value
+        if value.left.type == 'IDENTIFIER' and value.left.value == name and value.right.type == 'LITERAL':
+            constant = value.right.value
+        elif value.right.type == 'IDENTIFIER' and value.right.value == name and value.left.type == 'LITERAL':
+            if value.operator != 'PLUS':
+                return None
+            constant = value.left.value
+        else:
+            return None
+        if type(constant) is not int or constant == 0 or value.operator not in ('PLUS', 'MINUS'):
+            return None
+        step = constant if value.operator == 'PLUS' else -constant
+        
+        if (step > 0) != (self.COUNTING_COMPARISONS[condition.operator] > 0):
+            return None
+        if name in self.stored_names(loop.body[:-1], set()):
+            return None
+        if not self.is_invariant(condition.right, self.stored_names([loop], set()), not self.changes_maps(loop)):
+            return None
+        return step
+    
+    def changes_maps(self, loop):
+        """Whether running loop may set a key of a map: it calls set, or a user function that might"""
+        for node in self.walk(loop):
+            if node.type == 'CALL' and (not node.is_builtin or self.builtin_map.get(node.callee, node.callee) == 'set'):
+                return True
+        return False
+    
+    def is_invariant(self, node, assigned, maps_fixed):
+        """Whether node has the same value in every iteration of a loop
+        
+        assigned holds the names the loop stores; maps_fixed says that it
+        sets no key of a map. A map literal makes a new map every time.
+        """
+        node_type = node.type
+        if node_type == 'LITERAL' or node_type == 'HOISTED':
+            return True
+        if node_type == 'IDENTIFIER':
+            return node.value not in assigned
+        if node_type == 'BINARY':
+            return self.is_invariant(node.left, assigned, maps_fixed) and self.is_invariant(node.right, assigned, maps_fixed)
+        if node_type == 'UNARY':
+            return self.is_invariant(node.operand, assigned, maps_fixed)
+        if node_type == 'LIST':
+            return all(self.is_invariant(element, assigned, maps_fixed) for element in node.elements)
+        if not maps_fixed:
+            return False
+        if node_type == 'CALL' and self.is_pure_call(node):
+            return all(self.is_invariant(arg, assigned, maps_fixed) for arg in node.arguments)
+        if node_type == 'INDEX':
+            return self.is_invariant(node.target, assigned, maps_fixed) and self.is_invariant(node.index, assigned, maps_fixed)
+        return False
+'''
+    
+    def _generate_list_values(self):
+        """Generate the list value types, their bulk operations and the map key types"""
+        return r'''
+class NumberList(array):
+    """A list whose items are all ints or all floats, stored unboxed
+    
+    It prints like a Python list, and + and * give the same lists they
+    give for one, stored as make_list would store them. Lists are values:
+    nothing changes one after it is made, so list literals can be hoisted
+    and memoized.
+    """
+    
+    __slots__ = ()
+    TYPECODE = None
+    
+    def __new__(cls, items=()):
+        return array.__new__(cls, cls.TYPECODE, items)
+    
+    def __repr__(self):
+        return repr(self.tolist())
+    
+    __str__ = __repr__
+    
+    # array's own + and * return plain arrays, or fail on mixed item types
+    def __add__(self, other):
+        if not isinstance(other, LIST_TYPES):
+            raise TypeError(f'can only concatenate list (not "{type(other).__name__}") to list')
+        return make_list(self.tolist() + list(other))
+    
+    def __radd__(self, other):
+        if not isinstance(other, list):
+            raise TypeError(f"unsupported operand type(s) for +: '{type(other).__name__}' and 'list'")
+        return make_list(other + self.tolist())
+    
+    def __mul__(self, count):
+        if type(count) is not int:
+            raise TypeError(f"can't multiply sequence by non-int of type '{type(count).__name__}'")
+        return make_list(self.tolist() * count)
+    
+    __rmul__ = __mul__
+
+
+class IntList(NumberList):
+    __slots__ = ()
+    TYPECODE = 'q'
+
+
+class FloatList(NumberList):
+    __slots__ = ()
+    TYPECODE = 'd'
+
+
+# Types of list values: mixed and string items stay in a Python list
+LIST_TYPES = (list, NumberList)
+
+# Values an index selects an item of
+INDEXABLE_TYPES = (str,) + LIST_TYPES
+
+# Item types the bulk builtins compute with
+NUMBER_TYPES = (int, float)
+
+class FloatKey:
+    """A float map key, kept apart from the int key of equal value
+    
+    1 and 1.0 are equal in Python, so a dict would merge them, but they
+    print differently. map_key wraps floats in this and map_keys unwraps
+    them again.
+    """
+    
+    __slots__ = ('value',)
+    
+    def __init__(self, value):
+        self.value = value
+    
+    def __eq__(self, other):
+        return type(other) is FloatKey and self.value == other.value
+    
+    def __hash__(self):
+        return hash(self.value)
+    
+    def __repr__(self):
+        return repr(self.value)
+
+def map_keys(table):
+    """The keys of a map as values, in the order they were first set"""
+    return [key.value if type(key) is FloatKey else key for key in table]
+
+# Values with a length, which are false when empty
+COLLECTION_TYPES = LIST_TYPES + (dict,)
+
+def make_list(items):
+    """The list value holding items, a Python list: unboxed when they allow it"""
+    if items:
+        types = set(map(type, items))
+        if len(types) == 1:
+            if int in types:
+                try:
+                    return IntList(items)
+                except OverflowError:
+                    return items
+            if float in types:
+                return FloatList(items)
+    return items
+
+def vector_add(values, other):
+    """values plus other item by item, where other is a number or a list as long as values
+    
+    Float lists go through NumPy when it is installed, which adds with the
+    same IEEE doubles Python does.
+    """
+    if HAS_NUMPY and type(values) is FloatList and (type(other) is FloatList or type(other) is float):
+        added = numpy.frombuffer(values, dtype=numpy.float64)
+        added = added + (numpy.frombuffer(other, dtype=numpy.float64) if type(other) is FloatList else other)
+        result = FloatList()
+        result.frombytes(added.tobytes())
+        return result
+    if isinstance(other, LIST_TYPES):
+        return make_list(list(map(operator.add, values, other)))
+    return make_list([value + other for value in values])
+'''
+    
+    def _generate_binary_specializations(self):
+        """Generate the operator tables of the BINARY type feedback and the counting loops"""
+        return r'''
+# The operators of the tree-walker's generic BINARY path, except the ones
+# that check their operands or take their truthiness
+BINARY_OPERATORS = {
+    'PLUS': operator.add,
+    'MINUS': operator.sub,
+    'MULTIPLY': operator.mul,
+    'EQUALS': operator.eq,
+    'NOT_EQUALS': operator.ne,
+    'LESS': operator.lt,
+    'GREATER': operator.gt,
+    'LESS_EQUAL': operator.le,
+    'GREATER_EQUAL': operator.ge,
+}
+
+# Handlers for (operator, left type, right type) that need no type checks.
+# Division raises ZeroDivisionError, which the caller reports as the
+# language's division error
+SPECIALIZED_BINARY = {}
+for _type in (int, float):
+    SPECIALIZED_BINARY.update(((name, _type, _type), function) for name, function in BINARY_OPERATORS.items())
+    SPECIALIZED_BINARY[('DIVIDE', _type, _type)] = operator.truediv
+SPECIALIZED_BINARY.update(((name, str, str), BINARY_OPERATORS[name])
+                          for name in ('PLUS', 'EQUALS', 'NOT_EQUALS', 'LESS', 'GREATER', 'LESS_EQUAL', 'GREATER_EQUAL'))
+del _type
+
+# Operand type changes after which a BINARY node stops recording feedback
+BINARY_FEEDBACK_LIMIT = 4
+
+# What a counting loop adds to its bound to get the stop of its range
+COUNTING_BOUND_ADJUSTMENTS = {'LESS': 0, 'LESS_EQUAL': 1, 'GREATER': 0, 'GREATER_EQUAL': -1}
+'''
+    
+    def _generate_memo_table(self):
+        """Generate the result cache of memoized pure functions"""
+        return r'''
+class MemoTable:
+    """Least recently used results of one pure function, keyed by its arguments"""
+    
+    MAX_SIZE = 1 << 16
+    
+    def __init__(self, max_size=MAX_SIZE):
+        self.entries = OrderedDict()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def key(args, param_count):
+        """The arguments as bound to the parameters
+        
+        Missing arguments are None and extra ones are ignored, as in a call.
+        Types are part of the key, since 1, 1.0 and true are equal in Python
+        but print differently.
+        """
+        args = list(args[:param_count])
+        args.extend([None] * (param_count - len(args)))
+        if any([MemoTable.holds_map(arg) for arg in args]):
+            return None
+        return tuple([(type(arg), arg) if not isinstance(arg, LIST_TYPES) else MemoTable.frozen(arg)
+                      for arg in args])
+    
+    @staticmethod
+    def holds_map(value):
+        """Whether value is or contains a map, which may change after the call
+        
+        Such arguments have no key: the function runs every time.
+        """
+        if type(value) is dict:
+            return True
+        return type(value) is list and any([MemoTable.holds_map(item) for item in value])
+    
+    @staticmethod
+    def frozen(value):
+        """A hashable key part for a list, which holds the types and values of its items"""
+        if isinstance(value, LIST_TYPES):
+            return (type(value), tuple([MemoTable.frozen(item) for item in value]))
+        return (type(value), value)
+    
+    def lookup(self, key):
+        """Return the cached result for key, or UNSET"""
+        entries = self.entries
+        if key in entries:
+            entries.move_to_end(key)
+            self.hits += 1
+            return entries[key]
+        self.misses += 1
+        return UNSET
+    
+    def store(self, key, value):
+        entries = self.entries
+        entries[key] = value
+        if len(entries) > self.max_size:
+            entries.popitem(last=False)
+'''
+    
+    def _generate_output_sinks(self):
+        """Generate the sinks print writes its lines to"""
+        return r'''
+OUTPUT_SINKS = ('buffer', 'stream', 'ring')
+
+class OutputSink:
+    """Receives the lines print produces
+    
+    Engines call append(line) for every print. When a run ends, flush()
+    passes on lines still held back, or abort() does after a runtime error,
+    and getvalue() is the output the run returns. clear() forgets it again.
+    """
+    
+    def append(self, line):
+        raise NotImplementedError
+    
+    def flush(self):
+        pass
+    
+    def abort(self):
+        self.flush()
+    
+    def getvalue(self):
+        return ''
+    
+    def clear(self):
+        pass
+
+
+class BufferSink(OutputSink):
+    """Keeps every line and returns them all when the run ends; drops them on an error"""
+    
+    def __init__(self):
+        self.lines = []
+        self.append = self.lines.append
+    
+    def abort(self):
+        self.lines.clear()
+    
+    def getvalue(self):
+        return '\n'.join(self.lines)
+    
+    def clear(self):
+        self.lines.clear()
+
+
+class RingBufferSink(OutputSink):
+    """Keeps only the last max_lines lines, so output never grows past a bound"""
+    
+    MAX_LINES = 1000
+    
+    def __init__(self, max_lines=MAX_LINES):
+        self.lines = deque(maxlen=max_lines)
+        self.append = self.lines.append
+    
+    def abort(self):
+        # The tail of the output is kept to show what led to the error
+        pass
+    
+    def getvalue(self):
+        return '\n'.join(self.lines)
+    
+    def clear(self):
+        self.lines.clear()
+
+
+class CallbackSink(OutputSink):
+    """Passes lines on in batches to callback(lines)
+    
+    A batch is passed on once it holds flush_lines lines or flush_bytes
+    characters, and whatever is pending when the run ends.
+    """
+    
+    FLUSH_LINES = 1
+    FLUSH_BYTES = 1 << 16
+    
+    def __init__(self, callback, flush_lines=FLUSH_LINES, flush_bytes=FLUSH_BYTES):
+        self.callback = callback
+        self.flush_lines = max(1, flush_lines)
+        self.flush_bytes = flush_bytes
+        self.pending = []
+        self.pending_size = 0
+    
+    def append(self, line):
+        pending = self.pending
+        pending.append(line)
+        self.pending_size += len(line) + 1
+        if len(pending) >= self.flush_lines or self.pending_size >= self.flush_bytes:
+            self.flush()
+    
+    def flush(self):
+        if self.pending:
+            lines = self.pending
+            self.pending = []
+            self.pending_size = 0
+            self.callback(lines)
+
+
+class StreamSink(CallbackSink):
+    """Writes lines to a text stream, stdout by default, as the program runs"""
+    
+    FLUSH_LINES = 256
+    
+    def __init__(self, stream=None, flush_lines=FLUSH_LINES, flush_bytes=CallbackSink.FLUSH_BYTES):
+        super().__init__(self.write, flush_lines, flush_bytes)
+        self.stream = stream if stream is not None else sys.stdout
+    
+    def write(self, lines):
+        self.stream.write('\n'.join(lines) + '\n')
+        self.stream.flush()
+'''
+    
+    def _generate_profiler(self):
+        """Generate the collector of the deterministic --profile mode"""
+        return r'''
+class Profiler:
+    """Counts and times one run, fed by the wrappers Interpreter.install_profiler sets up
+    
+    node_counts maps node types to evaluations and line_hits source lines
+    to executions of the statements starting there. functions maps user
+    function names to [calls, inclusive seconds, exclusive seconds]; a
+    recursive function adds to its inclusive time only when its outermost
+    activation returns.
+    """
+    
+    PROGRAM = '<program>'
+    TABLE_ROWS = 20
+    
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.node_counts = {}
+        self.line_hits = {}
+        self.functions = {}
+        self.stack = []
+        self.active = {}
+    
+    def enter(self, name):
+        self.active[name] = self.active.get(name, 0) + 1
+        self.stack.append([name, self.clock(), 0.0])
+    
+    def leave(self):
+        name, start, children = self.stack.pop()
+        elapsed = self.clock() - start
+        stats = self.functions.get(name)
+        if stats is None:
+            stats = self.functions[name] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[2] += elapsed - children
+        self.active[name] -= 1
+        if not self.active[name]:
+            stats[1] += elapsed
+        if self.stack:
+            self.stack[-1][2] += elapsed
+    
+    def to_dict(self):
+        """The profile as JSON-ready data, each part sorted by cost"""
+        functions = sorted(self.functions.items(), key=lambda item: item[1][2], reverse=True)
+        return {
+            'functions': [{'name': name, 'calls': calls, 'inclusive': inclusive, 'exclusive': exclusive}
+                          for name, (calls, inclusive, exclusive) in functions],
+            'node_types': [{'type': node_type, 'count': count} for node_type, count
+                           in sorted(self.node_counts.items(), key=lambda item: item[1], reverse=True)],
+            'lines': [{'line': line, 'hits': hits} for line, hits
+                      in sorted(self.line_hits.items(), key=lambda item: (-item[1], item[0]))],
+        }
+    
+    def format_table(self):
+        """The profile as text tables, showing the TABLE_ROWS costliest rows of each"""
+        data = self.to_dict()
+        lines = [f"{'function':<24}{'calls':>10}{'inclusive ms':>15}{'exclusive ms':>15}"]
+        for row in data['functions'][:self.TABLE_ROWS]:
+            lines.append(f"{row['name']:<24}{row['calls']:>10}{row['inclusive'] * 1000:>15.3f}"
+                         f"{row['exclusive'] * 1000:>15.3f}")
+        lines.append('')
+        lines.append(f"{'node type':<24}{'evaluations':>10}")
+        for row in data['node_types'][:self.TABLE_ROWS]:
+            lines.append(f"{row['type']:<24}{row['count']:>10}")
+        lines.append('')
+        lines.append(f"{'line':<24}{'hits':>10}")
+        for row in data['lines'][:self.TABLE_ROWS]:
+            lines.append(f"{row['line']:<24}{row['hits']:>10}")
+        return '\n'.join(lines)
+'''
+    
+    def _generate_sampling_profiler(self):
+        """Generate the call stack sampler of the --sample mode"""
+        return r'''
+class SamplingProfiler:
+    """Snapshots the interpreter call stack from a background thread
+    
+    The engines keep call_stack up to date on every user function call,
+    so sampling costs the running program nothing but the sampler's own
+    turns on the GIL. samples holds (seconds since start, stack) pairs.
+    """
+    
+    INTERVAL = 0.001
+    # Lets the sampler take the GIL about as often as it asks for it
+    SWITCH_INTERVAL = 0.0005
+    
+    def __init__(self, call_stack, interval=INTERVAL):
+        self.call_stack = call_stack
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+        self.thread = None
+        self.switch_interval = None
+        self.started = 0.0
+    
+    def start(self):
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.switch_interval, self.SWITCH_INTERVAL, self.interval))
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self.run, name='sampler', daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        sys.setswitchinterval(self.switch_interval)
+    
+    def run(self):
+        call_stack = self.call_stack
+        samples = self.samples
+        clock = time.perf_counter
+        started = self.started
+        while not self.stopped.wait(self.interval):
+            samples.append((clock() - started, tuple(call_stack)))
+    
+    def folded(self):
+        """The samples in folded stack format, one line per distinct stack"""
+        counts = {}
+        for _, stack in self.samples:
+            key = ';'.join((Profiler.PROGRAM,) + stack)
+            counts[key] = counts.get(key, 0) + 1
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+    
+    def chrome_trace(self):
+        """The samples as Chrome trace events, one span per run of a stack frame"""
+        events = []
+        open_names = []
+        timestamp = 0.0
+        for seconds, stack in self.samples:
+            timestamp = round(seconds * 1e6, 3)
+            stack = (Profiler.PROGRAM,) + stack
+            common = 0
+            while common < len(open_names) and common < len(stack) and open_names[common] == stack[common]:
+                common += 1
+            while len(open_names) > common:
+                events.append({'name': open_names.pop(), 'ph': 'E', 'ts': timestamp, 'pid': 1, 'tid': 1})
+            for name in stack[common:]:
+                events.append({'name': name, 'ph': 'B', 'ts': timestamp, 'pid': 1, 'tid': 1})
+                open_names.append(name)
+        while open_names:
+            events.append({'name': open_names.pop(), 'ph': 'E', 'ts': timestamp, 'pid': 1, 'tid': 1})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+'''
+    
+    def _generate_python_backend(self):
+        """Generate the Python transpiler and its code object cache"""
+        return r'''
+class PythonTranslator:
+    """Translates the parsed AST into Python source for the python engine"""
+    
+    BINARY_OPERATORS = {
+        'PLUS': '+', 'MINUS': '-', 'MULTIPLY': '*',
+        'EQUALS': '==', 'NOT_EQUALS': '!=', 'LESS': '<', 'GREATER': '>',
+        'LESS_EQUAL': '<=', 'GREATER_EQUAL': '>='
+    }
+    BOOLEAN_OPERATORS = frozenset([
+        'EQUALS', 'NOT_EQUALS', 'LESS', 'GREATER', 'LESS_EQUAL', 'GREATER_EQUAL', 'AND', 'OR'
+    ])
+    
+    def __init__(self, builtin_map, dynamic_names=()):
+        self.builtin_map = builtin_map
+        self.dynamic_names = dynamic_names
+        self.lines = []
+        self.function_count = 0
+        self.function = None
+    
+    def translate(self, ast):
+        """Return Python source defining _program(V) for a PROGRAM node"""
+        # Cached code objects run without the resolver, so they carry its result
+        self.lines = [f"_dynamic_names.update({sorted(self.dynamic_names)!r})", 'def _program(V):']
+        self.function_count = 0
+        self.function = None
+        self.translate_block(ast.statements, 1)
+        return '\n'.join(self.lines) + '\n'
+    
+    def emit(self, depth, line):
+        self.lines.append('    ' * depth + line)
+    
+    def translate_block(self, statements, depth):
+        start = len(self.lines)
+        for stmt in statements:
+            self.translate_statement(stmt, depth)
+        if len(self.lines) == start:
+            self.emit(depth, 'pass')
+    
+    def translate_statement(self, node, depth):
+        node_type = node.type
+        
+        if node_type == 'VAR_DECL' or node_type == 'ASSIGN':
+            value = 'None' if node.value is None else self.expression(node.value)
+            self.emit(depth, f"V[{node.name!r}] = {value}")
+        
+        elif node_type == 'FUNC_DECL':
+            function = f"_f{self.function_count}"
+            self.function_count += 1
+            self.emit(depth, f"def {function}(V):")
+            enclosing, self.function = self.function, node
+            self.translate_block(node.body, depth + 1)
+            self.function = enclosing
+            self.emit(depth, f"_functions[{node.name!r}] = ({function}, {tuple(node.params)!r}, {node.pure!r})")
+        
+        elif node_type == 'IF_STMT':
+            self.emit(depth, f"if {self.condition(node.condition)}:")
+            self.translate_block(node.then_branch, depth + 1)
+            if node.else_branch:
+                self.emit(depth, 'else:')
+                self.translate_block(node.else_branch, depth + 1)
+        
+        elif node_type == 'LOOP_STMT':
+            for name in node.hoisted:
+                self.emit(depth, f"V.pop({name!r}, None)")
+            self.emit(depth, f"while {self.condition(node.condition)}:")
+            self.translate_block(node.body, depth + 1)
+        
+        elif node_type == 'FOR_STMT':
+            self.emit(depth, f"for V[{node.name!r}] in _iterate({self.expression(node.iterable)}):")
+            self.translate_block(node.body, depth + 1)
+        
+        elif node_type == 'RETURN_STMT':
+            value = 'None' if node.value is None else self.expression(node.value)
+            self.emit(depth, f"return {value}")
+        
+        elif node_type == 'EXPR_STMT':
+            self.emit(depth, self.expression(node.expression))
+        
+        else:
+            raise NotImplementedError(f"python engine cannot translate {node_type}")
+    
+    def condition(self, node):
+        if node.type == 'BINARY' and node.operator in self.BOOLEAN_OPERATORS:
+            return self.expression(node)
+        return f"_truthy({self.expression(node)})"
+    
+    def expression(self, node):
+        node_type = node.type
+        
+        if node_type == 'LITERAL':
+            return repr(node.value)
+        
+        if node_type == 'IDENTIFIER':
+            # V is the globals at the top level and the frame dict in a function
+            name = node.value
+            if self.function is not None and name in self.function.params:
+                return f"V[{name!r}]"
+            if self.function is None:
+                return f"(V[{name!r}] if {name!r} in V else _undefined({name!r}))"
+            if name in self.function.slot_index or name in self.dynamic_names:
+                return f"_load(V, {name!r})"
+            return f"(_G[{name!r}] if {name!r} in _G else _undefined({name!r}))"
+        
+        if node_type == 'BINARY':
+            left = self.expression(node.left)
+            right = self.expression(node.right)
+            operator = node.operator
+            if operator in self.BINARY_OPERATORS:
+                return f"({left} {self.BINARY_OPERATORS[operator]} {right})"
+            if operator == 'DIVIDE':
+                return f"_divide({left}, {right})"
+            if operator == 'AND':
+                return f"_and({left}, {right})"
+            if operator == 'OR':
+                return f"_or({left}, {right})"
+        
+        elif node_type == 'UNARY':
+            operand = self.expression(node.operand)
+            if node.operator == 'MINUS':
+                return f"(-{operand})"
+            return f"_discard({operand})"
+        
+        elif node_type == 'CALL':
+            arguments = [self.expression(arg) for arg in node.arguments]
+            if node.is_builtin:
+                builtin_type = self.builtin_map.get(node.callee, node.callee)
+                return f"_builtins[{builtin_type!r}]({', '.join(arguments)})"
+            return f"_call(V, {node.callee!r}, ({''.join(arg + ', ' for arg in arguments)}))"
+        
+        elif node_type == 'HOISTED':
+            # Hidden names live in V, the frame dict or the globals, like any local
+            name = node.name
+            return f"(V[{name!r}] if {name!r} in V else _keep(V, {name!r}, {self.expression(node.expression)}))"
+        
+        elif node_type == 'LIST':
+            return f"_list([{', '.join(self.expression(element) for element in node.elements)}])"
+        
+        elif node_type == 'MAP':
+            return f"_map([{', '.join(self.expression(item) for item in node.items)}])"
+        
+        elif node_type == 'INDEX':
+            return f"_index({self.expression(node.target)}, {self.expression(node.index)})"
+        
+        raise NotImplementedError(f"python engine cannot translate {node_type}")
+
+class PythonBackend:
+    """Compiles translated programs and caches their code objects in a per-user directory
+    
+    A code object runs when loaded, so unlike the AST cache it never lives
+    next to the source, where a downloaded example pack could bring its own.
+    Entries are only read from a directory that nobody but the current user
+    can write. The key covers the source, the language definition and the
+    interpreter itself, like the key of the AST cache.
+    """
+    
+    VERSION = 8
+    DIRECTORY = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                             'slang-python')
+    
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+    
+    def cache_key(self, source):
+        """Hash of the source, the language definition, the interpreter, the backend version and the optimizer passes"""
+        digest = hashlib.sha256()
+        digest.update(f"{self.VERSION}:{sys.implementation.cache_tag}:{AstCache.hash_interpreter()}:"
+                      f"{self.interpreter.optimizer_key()}:".encode('utf-8'))
+        digest.update(self.interpreter.language_hash.encode('utf-8'))
+        digest.update(source.encode('utf-8'))
+        return digest.hexdigest()
+    
+    def cache_file(self, filename):
+        """One entry per source path, replaced when the source changes"""
+        name = hashlib.sha256(os.path.abspath(filename).encode('utf-8')).hexdigest()
+        return os.path.join(self.DIRECTORY, name + '.pyc')
+    
+    def trusted(self):
+        """Whether the cache directory belongs to this user and nobody else can write it"""
+        try:
+            info = os.stat(self.DIRECTORY)
+        except OSError:
+            return False
+        if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+            return False
+        return not info.st_mode & 0o022
+    
+    def load_cached(self, source, filename):
+        """Return the cached code object for source, or None if there is no current one"""
+        if not filename or not self.trusted():
+            return None
+        try:
+            with open(self.cache_file(filename), 'rb') as f:
+                if f.readline().rstrip(b'\n') != self.cache_key(source).encode('ascii'):
+                    return None
+                return marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+    
+    def compile(self, ast, source, filename):
+        """Translate and compile an AST, then write the code object to the cache"""
+        interp = self.interpreter
+        python_source = PythonTranslator(interp.builtin_map, interp.dynamic_names).translate(ast)
+        code = compile(python_source, filename or '<program>', 'exec')
+        
+        if filename:
+            cache_file = self.cache_file(filename)
+            temp_file = f"{cache_file}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(self.DIRECTORY, mode=0o700, exist_ok=True)
+                with open(temp_file, 'wb') as f:
+                    f.write(self.cache_key(source).encode('ascii') + b'\n')
+                    marshal.dump(code, f)
+                os.replace(temp_file, cache_file)
+            except OSError:
+                pass
+        
+        return code
+    
+    def runtime_namespace(self):
+        """Globals the translated code runs against"""
+        interp = self.interpreter
+        is_truthy = interp.is_truthy
+        error = interp.error
+        output = interp.output
+        variables = interp.variables
+        dynamic_names = interp.dynamic_names
+        memoize = interp.memoize
+        call_stack = interp.call_stack
+        functions = {}
+        scopes = []
+        
+        def call(V, name, args):
+            entry = functions.get(name)
+            if entry is None:
+                error(f"Undefined function: {name}")
+            function, params, pure = entry
+            if pure and memoize:
+                table = interp.memo_table(name)
+                key = MemoTable.key(args, len(params))
+                if key is None:
+                    return run(name, function, params, args)
+                result = table.lookup(key)
+                if result is UNSET:
+                    result = run(name, function, params, args)
+                    table.store(key, result)
+                return result
+            return run(name, function, params, args)
+        
+        def run(name, function, params, args):
+            scope = {}
+            argc = len(args)
+            for i, param in enumerate(params):
+                scope[param] = args[i] if i < argc else None
+            scopes.append(scope)
+            call_stack.append(name)
+            result = function(scope)
+            call_stack.pop()
+            scopes.pop()
+            return result
+        
+        def load(V, name):
+            if name in V:
+                return V[name]
+            if name in dynamic_names:
+                for scope in reversed(scopes):
+                    if name in scope:
+                        return scope[name]
+            if name in variables:
+                return variables[name]
+            undefined(name)
+        
+        def undefined(name):
+            error(f"Undefined variable: {name}")
+        
+        def divide(a, b):
+            if b != 0:
+                return a / b
+            error("Division by zero")
+        
+        def keep(V, name, value):
+            V[name] = value
+            return value
+        
+        def make_builtin(name):
+            handler = interp.builtin_handler(name)
+            return lambda *args: handler(list(args))
+        
+        builtins = {}
+        for custom, standard in interp.builtin_map.items():
+            if standard == 'print':
+                builtins[standard] = lambda *args: output.append(' '.join([str(arg) for arg in args]))
+            else:
+                builtins[standard] = make_builtin(custom)
+        
+        return {
+            '_G': variables,
+            '_dynamic_names': dynamic_names,
+            '_call': call,
+            '_load': load,
+            '_undefined': undefined,
+            '_divide': divide,
+            '_and': lambda a, b: is_truthy(a) and is_truthy(b),
+            '_or': lambda a, b: is_truthy(a) or is_truthy(b),
+            '_discard': lambda value: None,
+            '_keep': keep,
+            '_truthy': is_truthy,
+            '_iterate': interp.iterate,
+            '_list': make_list,
+            '_map': interp.build_map,
+            '_index': interp.index_value,
+            '_builtins': builtins,
+            '_functions': functions,
+        }
+    
+    def run(self, code):
+        """Execute a compiled program and return its output"""
+        interp = self.interpreter
+        try:
+            namespace = self.runtime_namespace()
+            exec(code, namespace)
+            namespace['_program'](interp.variables)
+            return interp.output_text()
+        except Exception as e:
+            return interp.output_text(f"Runtime error: {str(e)}")
+        finally:
+            # The calls an error unwound never returned
+            interp.call_stack.clear()
+            interp.frames.clear()
+'''
+
+class CodeExecutor:
+    """Handles code execution and simulation in the playground"""
     
     def __init__(self, language_data):
         self.language_data = language_data
@@ -1001,65 +5109,242 @@ class TestFileCreator:
         test_runner = f'''#!/usr/bin/env python3
 """
 Test Runner for {self.language_data['name']}
-Runs all .{lang_name[:3]} files in the examples directory
+Runs all .{lang_name[:3]} files in the examples directory on a pool of worker processes
 """
 
+import argparse
+import json
 import os
-import sys
+import queue
 import subprocess
+import sys
+import threading
+import time
 from pathlib import Path
 
-def run_test(filename):
-    """Run a single test file"""
-    print(f"\\n{'='*50}")
-    print(f"Running: {{filename}}")
-    print('='*50)
-    
+ROOT = Path(__file__).parent
+INTERPRETER = ROOT / 'src' / '{lang_name}.py'
+
+# Starts the JSON line the interpreter prints for each file in --batch mode
+BATCH_RECORD_PREFIX = {InterpreterGenerator.BATCH_RECORD_PREFIX!r}
+
+# Engines the interpreter can run a file on
+ENGINES = {InterpreterGenerator.ENGINES!r}
+
+# Seconds each file took on earlier runs, used to balance the shards
+TIMINGS_FILE = ROOT / '.test_timings.json'
+DEFAULT_TIMEOUT = 60.0
+
+print_lock = threading.Lock()
+
+def timing_key(path):
+    """Name of a test file in the timings file"""
+    try:
+        return path.relative_to(ROOT).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+def load_timings():
+    """Load the timings saved by earlier runs"""
+    try:
+        with open(TIMINGS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {{}}
+
+def save_timings(timings):
+    """Save the timings for the next run"""
     try:
-        result = subprocess.run([
-            sys.executable, 
-            f'src/{lang_name}.py', 
-            filename
-        ], capture_output=True, text=True, cwd=os.path.dirname(__file__))
-        
-        if result.returncode == 0:
-            print("✅ SUCCESS")
-            if result.stdout:
-                print("Output:")
-                print(result.stdout)
+        with open(TIMINGS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(timings, f, indent=2, sort_keys=True)
+    except OSError as e:
+        print(f"Could not save timings: {{e}}")
+
+def make_shards(test_files, timings, workers):
+    """Split the test files into shards that should take about as long each
+    
+    Files are dealt out slowest first, each to the shard with the least
+    expected time so far. Files not timed before count as the average.
+    """
+    known = [timings[timing_key(path)] for path in test_files if timing_key(path) in timings]
+    default = sum(known) / len(known) if known else 1.0
+    expected = {{path: timings.get(timing_key(path), default) for path in test_files}}
+    
+    shards = [[] for _ in range(max(1, min(workers, len(test_files))))]
+    loads = [0.0] * len(shards)
+    for path in sorted(test_files, key=lambda path: expected[path], reverse=True):
+        index = loads.index(min(loads))
+        shards[index].append(path)
+        loads[index] += expected[path]
+    return shards
+
+def read_lines(stream, lines):
+    """Pass the lines of a stream to a queue, then None at its end"""
+    for line in stream:
+        lines.put(line)
+    lines.put(None)
+
+def run_shard(number, shard, engine, timeout, results, verbose):
+    """Run the files of a shard through one interpreter process in --batch mode
+    
+    engine is passed on to the interpreter, unless it is None.
+    Each file must finish within timeout seconds of the one before it.
+    When a file times out, the process dies or its record cannot be read,
+    the process is killed and started again on the files still pending.
+    Lines without a record, such as prompts, are skipped.
+    """
+    pending = list(shard)
+    while pending:
+        command = [sys.executable, str(INTERPRETER), '--batch'] + (['--engine', engine] if engine else [])
+        process = subprocess.Popen(command + [str(path) for path in pending],
+                                   stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   text=True, encoding='utf-8', cwd=ROOT)
+        lines = queue.Queue()
+        errors = []
+        threading.Thread(target=read_lines, args=(process.stdout, lines), daemon=True).start()
+        threading.Thread(target=errors.extend, args=(process.stderr,), daemon=True).start()
+        
+        started = time.perf_counter()
+        while pending:
+            path = pending[0]
+            try:
+                # Skipped lines do not restart the clock of the file
+                line = lines.get(timeout=max(0.0, started + timeout - time.perf_counter()))
+            except queue.Empty:
+                process.kill()
+                record = {{'status': 'timeout', 'output': '', 'error': f"Timed out after {{timeout}}s",
+                          'seconds': round(time.perf_counter() - started, 6)}}
+            else:
+                if line is None:
+                    process.wait()
+                    record = {{'status': 'crashed', 'output': '',
+                              'error': ''.join(errors).strip() or f"Exited with code {{process.returncode}}",
+                              'seconds': round(time.perf_counter() - started, 6)}}
+                else:
+                    # A prompt written by input() may precede the record of its file
+                    start = line.find(BATCH_RECORD_PREFIX)
+                    if start < 0:
+                        continue
+                    try:
+                        record = json.loads(line[start + len(BATCH_RECORD_PREFIX):])
+                    except ValueError:
+                        process.kill()
+                        record = {{'status': 'crashed', 'output': '', 'error': f"Unreadable record: {{line.strip()}}",
+                                  'seconds': round(time.perf_counter() - started, 6)}}
+            
+            pending.pop(0)
+            record['file'] = timing_key(path)
+            record['engine'] = engine
+            record['shard'] = number
+            results.append(record)
+            report(record, verbose)
+            started = time.perf_counter()
+            if record['status'] in ('timeout', 'crashed'):
+                break
+        
+        process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+def report(record, verbose):
+    """Print the outcome of one test file"""
+    name = record['file'] if record['engine'] is None else f"{{record['file']}} on {{record['engine']}}"
+    with print_lock:
+        if record['status'] == 'ok':
+            print(f"✅ {{name}} ({{record['seconds']:.3f}}s)")
+            if verbose and record['output']:
+                print(record['output'])
         else:
-            print("❌ FAILED")
-            if result.stderr:
-                print("Error:")
-                print(result.stderr)
-                
-    except Exception as e:
-        print(f"❌ ERROR: {{e}}")
+            print(f"❌ {{name}} [{{record['status']}}] ({{record['seconds']:.3f}}s)")
+            if record['output']:
+                print(record['output'])
+            if record['error'] and record['error'] not in record['output']:
+                print(record['error'])
 
 def main():
     """Run all tests"""
-    examples_dir = Path(__file__).parent / "examples"
-    
-    if not examples_dir.exists():
-        print("No examples directory found")
-        return
+    parser = argparse.ArgumentParser(description={(self.language_data['name'] + ' examples, run in parallel')!r})
+    parser.add_argument('files', nargs='*', help='test files to run (default: examples/*.{lang_name[:3]})')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1,
+                        help='interpreter processes to run at once (default: one per CPU)')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help='seconds each test file may run')
+    parser.add_argument('--summary', default=str(ROOT / 'test_summary.json'),
+                        help='where to write the JSON summary')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='print the output of passing files too')
+    parser.add_argument('--engine', action='append', choices=ENGINES + ('all',),
+                        help='engine to run the files on; give it more than once, or all, '
+                             'to run them on each (default: the interpreter default)')
+    args = parser.parse_args()
+    engines = list(ENGINES) if args.engine and 'all' in args.engine else args.engine or [None]
     
-    test_files = list(examples_dir.glob(f"*.{lang_name[:3]}"))
+    if args.files:
+        test_files = [Path(name).resolve() for name in args.files]
+    else:
+        examples_dir = ROOT / "examples"
+        
+        if not examples_dir.exists():
+            print("No examples directory found")
+            return 0
+        
+        test_files = sorted(examples_dir.glob(f"*.{lang_name[:3]}"))
     
     if not test_files:
         print(f"No .{lang_name[:3]} files found in examples/")
-        return
+        return 0
     
-    print(f"Found {{len(test_files)}} test files")
+    timings = load_timings()
+    shards = make_shards(test_files, timings, args.workers)
+    print(f"Found {{len(test_files)}} test files, running on {{len(shards)}} workers")
     
-    for test_file in test_files:
-        run_test(test_file)
+    results = []
+    started = time.perf_counter()
+    for engine in engines:
+        threads = [threading.Thread(target=run_shard, args=(number, shard, engine, args.timeout, results, args.verbose))
+                   for number, shard in enumerate(shards)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    wall_time = time.perf_counter() - started
+    
+    for record in results:
+        timings[record['file']] = record['seconds']
+    save_timings(timings)
+    
+    # Every file found must have a result on every engine, even if its shard stopped early
+    reported = {{(record['engine'], record['file']) for record in results}}
+    for engine in engines:
+        for path in test_files:
+            if (engine, timing_key(path)) not in reported:
+                record = {{'file': timing_key(path), 'engine': engine, 'shard': None, 'status': 'crashed',
+                          'output': '', 'error': 'No result from its worker', 'seconds': 0.0}}
+                results.append(record)
+                report(record, args.verbose)
+    
+    results.sort(key=lambda record: (record['file'], record['engine'] or ''))
+    passed = sum(1 for record in results if record['status'] == 'ok')
+    assert len(results) == len(test_files) * len(engines), (len(results), len(test_files), len(engines))
+    summary = {{
+        'language': {self.language_data['name']!r},
+        'engines': engines,
+        'workers': len(shards),
+        'timeout': args.timeout,
+        'wall_time': round(wall_time, 6),
+        'passed': passed,
+        'failed': len(results) - passed,
+        'results': results,
+    }}
+    with open(args.summary, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
     
-    print(f"\\n{'='*50}")
-    print("All tests completed")
+    print(f"\\n{{'='*50}}")
+    print(f"{{passed}} passed, {{len(results) - passed}} failed in {{wall_time:.2f}}s (summary: {{args.summary}})")
+    return 0 if passed == len(results) else 1
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
 '''
         
         test_file = os.path.join(export_folder, 'run_tests.py')
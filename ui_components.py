@@ -612,6 +612,7 @@ sayHello("Coder")"""
             ('else', 'Else statement keyword'),
             ('while', 'While loop keyword'),
             ('for', 'For loop keyword'),
+            ('in', 'For loop item keyword'),
             ('return', 'Return statement keyword'),
             ('print', 'Print/output keyword'),
             ('input', 'Input keyword'),
@@ -969,6 +970,13 @@ sayHello("Coder")"""
             ('max', 'max', 'Get maximum value'),
             ('min', 'min', 'Get minimum value'),
             ('sum', 'sum', 'Sum of numbers'),
+            ('sort', 'sort', 'Sorted copy of a list'),
+            ('map_add', 'map_add', 'Add a number or list to every item of a list'),
+            ('dot', 'dot', 'Dot product of two lists'),
+            ('get', 'get', 'Look up the value of a map key'),
+            ('set', 'set', 'Store a value under a map key'),
+            ('has', 'has', 'Check whether a map has a key'),
+            ('keys', 'keys', 'List the keys of a map'),
             ('abs', 'abs', 'Absolute value'),
             ('round', 'round', 'Round number'),
             ('random', 'random', 'Random number generator'),